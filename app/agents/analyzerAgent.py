@@ -1,13 +1,13 @@
 # app/agents/analyzerAgent.py
-from app.agents.baseAgent import get_openai_client
+from app.core.llm_gateway import get_llm_gateway
 from app.core.config import settings
 import json
 
 class AnalyzerAgent:
     def __init__(self):
-        self.client = get_openai_client()  # Reuse shared client
+        self.llm = get_llm_gateway()
 
-    def interpret(self, soil_data: dict, language: str = "fr") -> str:
+    async def interpret(self, soil_data: dict, language: str = "fr", on_token=None) -> str:
         """Returns a clear agronomic interpretation in the requested language."""
         system_prompt = (
             "Tu es un agronome expert en sciences du sol. Tu maitrises particulièrement bien les cultures et les sols ouest africains "
@@ -40,12 +40,12 @@ Fournis une interprétation agronomique détaillée en suivant EXACTEMENT cette
 - **Action Prioritaire**: Quelle est la chose la plus importante à faire en premier ?
 """
         
-        response = self.client.chat.completions.create(
+        return await self.llm.chat(
+            on_token=on_token,
             model=settings.MODEL_NAME,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        )
\ No newline at end of file
@@ -1,5 +1,14 @@
 # app/agents/extractor_agent.py
+import asyncio
+from pydantic import ValidationError
 from app.agents.baseAgent import BaseAgent
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.rule_extractor import extract_rule_based, score_lines, with_context
+from app.core.utils import PAGE_SEPARATOR, clean_text, count_tokens, truncate_to_tokens
+from app.models.schemas import ExtractionResult
+
+logger = get_logger(__name__)
 
 class ExtractorAgent(BaseAgent):
     def __init__(self):
@@ -8,14 +17,168 @@ class ExtractorAgent(BaseAgent):
             role="Tu es un assistant chargé d'extraire les paramètres d'une analyse de sol. Tu réponds TOUJOURS avec du JSON valide."
         )
 
-    def extract_parameters(self, text: str) -> dict:
+    def _prepare_text(self, text: str) -> str:
+        """Text sent to the LLM: normalized lines. Over the token budget, only the lines
+        likely to contain parameters (numbers near parameter names, with the value and
+        unit lines around them) are kept, best ones first.
+        """
+        lines = [clean_text(line) for line in text.splitlines()]
+        lines = [line for line in lines if line]
+        budget = settings.EXTRACTION_TOKEN_BUDGET
+        before = count_tokens(text)
+
+        scores = with_context(lines, score_lines(lines), settings.EXTRACTION_CONTEXT_LINES)
+        if settings.EXTRACTION_FILTER and before > budget and any(scores):
+            candidates = [(i, line, score) for i, (line, score) in enumerate(zip(lines, scores)) if score]
+            # Highest score first, document order within a score; then restore document order
+            kept, used = [], 0
+            for i, line, score in sorted(candidates, key=lambda c: (-c[2], c[0])):
+                cost = count_tokens(line) + 1
+                if used + cost > budget:
+                    continue
+                kept.append((i, line))
+                used += cost
+            selected = "\n".join(line for _, line in sorted(kept))
+        else:
+            # Within budget, or unstructured text without recognizable parameters: keep it all
+            selected = truncate_to_tokens("\n".join(lines), budget)
+
+        logger.info("Prompt extraction: %d → %d tokens", before, count_tokens(selected))
+        return selected
+
+    async def extract_parameters(self, text: str) -> dict:
         """Retourne un dictionnaire des paramètres clés"""
-        import json
-        import re
+        # Fast path: structured reports ("pH = 6.5", "MO 2.3%") are parsed without the LLM
+        # (CPU-bound on long reports: parsing and text preparation run in a worker thread)
+        if settings.RULE_EXTRACTION:
+            rule_parameters, confidence = await asyncio.to_thread(extract_rule_based, text)
+            if confidence >= settings.RULE_EXTRACTION_MIN_CONFIDENCE and len(rule_parameters) >= settings.RULE_EXTRACTION_MIN_PARAMS:
+                logger.info("Extraction par règles: %d paramètres (confiance %s)", len(rule_parameters), confidence)
+                return rule_parameters
+            logger.info("Extraction par règles insuffisante (%d paramètres, confiance %s), appel du LLM", len(rule_parameters), confidence)
         
-        # Use full text - no truncation to capture all parameters
-        text_sample = text
+        # Long reports: one prompt per group of pages, merged afterwards
+        chunks = await asyncio.to_thread(self._chunk_text, text) if settings.EXTRACTION_CHUNKING else []
+        if len(chunks) > 1:
+            return await self._extract_chunked(chunks)
         
+        # Only the relevant lines, within EXTRACTION_TOKEN_BUDGET
+        return await self._extract_llm(await asyncio.to_thread(self._prepare_text, text))
+
+    def _chunk_text(self, text: str) -> list:
+        """Relevant lines of the report packed into chunks of at most
+        EXTRACTION_TOKEN_BUDGET tokens, following page boundaries where possible.
+        A single chunk means the report fits in one prompt.
+        """
+        budget = settings.EXTRACTION_TOKEN_BUDGET
+        pages = []
+        for page in text.split(PAGE_SEPARATOR):
+            lines = [clean_text(line) for line in page.splitlines()]
+            pages.append([line for line in lines if line])
+
+        if settings.EXTRACTION_FILTER and count_tokens(text) > budget:
+            scores = [with_context(lines, score_lines(lines), settings.EXTRACTION_CONTEXT_LINES) for lines in pages]
+            if any(any(page_scores) for page_scores in scores):
+                pages = [[line for line, score in zip(lines, page_scores) if score]
+                         for lines, page_scores in zip(pages, scores)]
+
+        chunks, current, used = [], [], 0
+        for lines in pages:
+            cost = sum(count_tokens(line) + 1 for line in lines)
+            if current and used + cost > budget:
+                chunks.append(current)
+                current, used = [], 0
+            # A page over the budget on its own (large sample tables) is split by lines
+            for line in lines:
+                line_cost = count_tokens(line) + 1
+                if current and used + line_cost > budget:
+                    chunks.append(current)
+                    current, used = [], 0
+                current.append(line)
+                used += line_cost
+        if current:
+            chunks.append(current)
+        return ["\n".join(lines) for lines in chunks]
+
+    async def _extract_chunked(self, chunks: list) -> dict:
+        """Map: extract every chunk, at most EXTRACTION_CONCURRENCY at a time. Reduce: merge in chunk order."""
+        semaphore = asyncio.Semaphore(max(1, settings.EXTRACTION_CONCURRENCY))
+
+        async def extract(chunk):
+            async with semaphore:
+                return await self._extract_llm(truncate_to_tokens(chunk, settings.EXTRACTION_TOKEN_BUDGET))
+
+        logger.info("Extraction par morceaux: %d morceaux, %d en parallèle", len(chunks), settings.EXTRACTION_CONCURRENCY)
+        partials = await asyncio.gather(*(extract(chunk) for chunk in chunks))
+        failed = sum(1 for partial in partials if not isinstance(partial, dict) or "error" in partial)
+        if failed:
+            logger.warning("%d/%d morceaux sans extraction valide", failed, len(chunks))
+        return self._merge_parameters(partials)
+
+    @staticmethod
+    def _merge_parameters(partials: list) -> dict:
+        """Merge per-chunk extractions into one {"param": {"valeur", "unite"}} dict.
+        Deterministic: keys keep their first spelling and position, values of the
+        same parameter are concatenated in chunk order (one value per sample, repeats
+        included), a chunk repeating an already merged list of values (page header
+        repeated across chunks) is skipped, and the first non-empty unit wins.
+        """
+        merged = {}  # normalized key -> (key, values, unit) or (key, raw value, None) for nested values
+        contributed = {}  # normalized key -> value lists already merged, as tuples
+        for partial in partials:
+            if not isinstance(partial, dict) or "error" in partial:
+                continue
+            items = []
+            for key, value in partial.items():
+                if key == "texte_brut":
+                    continue
+                if key == "autres_parametres" and isinstance(value, dict):
+                    items.extend(value.items())
+                else:
+                    items.append((key, value))
+
+            for key, value in items:
+                norm = key.strip().lower().replace(" ", "_")
+                if isinstance(value, dict) and "valeur" not in value:
+                    # Nested structure (e.g. texture details): first occurrence kept as-is
+                    merged.setdefault(norm, (key, value, None))
+                    continue
+                if isinstance(value, dict):
+                    raw, unit = value.get("valeur", ""), value.get("unite", "") or ""
+                else:
+                    raw, unit = value, ""
+                entry = merged.setdefault(norm, (key, [], ""))
+                if entry[2] is None:
+                    continue
+                values = entry[1]
+                # "4.2, 5.1" lists several samples; "6,5" alone is a decimal comma
+                parts = tuple(part.strip() for part in str(raw).split(", ") if part.strip())
+                seen = contributed.setdefault(norm, set())
+                if parts and parts not in seen:
+                    seen.add(parts)
+                    values.extend(parts)
+                if unit and not entry[2]:
+                    merged[norm] = (entry[0], values, unit)
+
+        parameters = {}
+        for key, values, unit in merged.values():
+            if unit is None:
+                parameters[key] = values
+            elif values:
+                parameters[key] = {"valeur": ", ".join(values), "unite": unit}
+
+        if parameters:
+            return parameters
+        # Nothing found in any chunk: same answers as the single-prompt path
+        errors = [p for p in partials if isinstance(p, dict) and "error" in p]
+        if errors and len(errors) == len(partials):
+            return errors[0]
+        return {"texte_brut": "Désolé, je n'ai pas trouvé de paramètres dans ce document"}
+
+    async def _extract_llm(self, text_sample: str) -> dict:
+        """LLM extraction of one text sample, constrained to the ExtractionResult JSON schema.
+        An invalid answer gets one repair attempt; returns {"error": ...} if it is still invalid.
+        """
         prompt = f"""
         Tu dois extraire les paramètres d'analyse de sol du texte ci-dessous.
         Le texte peut être structuré (tableau) ou non structuré (paragraphes).
@@ -29,51 +192,50 @@ class ExtractorAgent(BaseAgent):
            - calcium (Ca), magnésium (Mg), sodium (Na), CEC, conductivité (CE)
            - texture (argile, limon, sable), carbone (C), C/N, etc.
         
-        2. Pour chaque paramètre trouvé:
-           - Si UNE SEULE valeur: {{"valeur": "5.2", "unite": "unité"}}
-           - Si PLUSIEURS valeurs: {{"valeur": "4.2, 5.1, 6.3", "unite": "unité"}}
-           - Si PLAGE (min-max): {{"valeur": "4.2 - 6.3", "unite": "unité"}}
-           - Toujours inclure l'unité si disponible
+        2. Ajoute un élément à "parametres" pour chaque paramètre trouvé:
+           - Si UNE SEULE valeur: {{"nom": "pH", "valeur": "5.2", "unite": ""}}
+           - Si PLUSIEURS valeurs: {{"nom": "phosphore", "valeur": "4.2, 5.1, 6.3", "unite": "ppm"}}
+           - Si PLAGE (min-max): {{"nom": "potassium", "valeur": "4.2 - 6.3", "unite": "meq/100g"}}
+           - Toujours inclure l'unité si disponible (chaîne vide sinon)
         
         3. Accepte TOUTES les formes:
            - "pH = 6.5" ou "pH: 6.5" ou "le pH est de 6.5"
            - "MO 2.3%" ou "matière organique: 2.3 %"
            - "P: 12, 15, 18 ppm" (plusieurs échantillons)
         
-        4. Si tu trouves au moins UN paramètre, retourne-le en JSON
-        5. Si AUCUN paramètre n'est trouvé, retourne: {{"texte_brut": "Désolé, je n'ai pas trouvé de paramètres dans ce document"}}
-        
-        EXEMPLES DE RÉPONSE:
-        {{
-          "pH": {{"valeur": "5.3 - 7.7", "unite": ""}},
-          "matiere_organique": {{"valeur": "0.28, 1.53", "unite": "%"}},
-          "phosphore": {{"valeur": "12.5", "unite": "ppm"}},
-          "potassium": {{"valeur": "0.4 - 7.0", "unite": "meq/100g"}}
-        }}
-        
-        Réponds UNIQUEMENT avec du JSON valide, rien d'autre.
+        4. Si AUCUN paramètre n'est trouvé, retourne une liste "parametres" vide.
         """
-        try:
-            raw = self.run(prompt)
-            print(f"\n=== RÉPONSE BRUTE EXTRACTOR ===")
-            print(raw)
-            print("\n=== FIN RÉPONSE ===")
-            
-            # Try to extract JSON from markdown code blocks if present
-            json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', raw, re.DOTALL)
-            if json_match:
-                raw = json_match.group(1)
-            
-            # Clean up common issues
-            raw = raw.strip()
-            
-            return json.loads(raw)
-        except json.JSONDecodeError as e:
-            print(f"\n=== ERREUR JSON ===")
-            print(f"Erreur: {e}")
-            print(f"Texte reçu: {raw[:200]}")
-            return {"error": "Impossible d'extraire correctement les paramètres.", "raw_response": raw[:200]}
-        except Exception as e:
-            print(f"\n=== ERREUR GENERALE ===")
-            print(f"Erreur: {e}")
-            return {"error": f"Erreur lors de l'extraction: {str(e)}"}
+        messages = [{"role": "system", "content": self.role},
+                    {"role": "user", "content": prompt}]
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": "soil_parameters", "strict": True, "schema": ExtractionResult.model_json_schema()},
+        }
+
+        raw = ""
+        for attempt in range(2):
+            try:
+                raw = await self.llm.chat(
+                    model=settings.MODEL_NAME,
+                    messages=messages,
+                    temperature=0,
+                    response_format=response_format,
+                )
+                parameters = ExtractionResult.model_validate_json(raw).to_parameters()
+            except ValidationError as e:
+                logger.warning("Réponse JSON invalide de l'extracteur (tentative %d): %s; texte reçu: %s", attempt + 1, e, raw[:200])
+                # Single repair attempt: show the model its answer and the validation errors
+                messages = messages + [
+                    {"role": "assistant", "content": raw},
+                    {"role": "user", "content": f"Cette réponse ne respecte pas le schéma JSON demandé:\n{e}\nCorrige-la."},
+                ]
+                continue
+            except Exception as e:
+                logger.exception("Erreur lors de l'extraction: %s", e)
+                return {"error": f"Erreur lors de l'extraction: {str(e)}"}
+
+            if not parameters:
+                return {"texte_brut": "Désolé, je n'ai pas trouvé de paramètres dans ce document"}
+            return parameters
+
+        return {"error": "Impossible d'extraire correctement les paramètres."}
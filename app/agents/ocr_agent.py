@@ -1,30 +1,158 @@
 import os
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.utils import PAGE_SEPARATOR
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# PyMuPDF, PIL and pytesseract (which imports pandas) are imported on first use:
+# they are a large share of the worker boot time, and the OCR ones are optional
+# (requirements/ocr.txt), only needed for scanned pages.
+
+# Recognized text per page, keyed on the page content (see page_fingerprint)
+ocr_page_cache = cache.namespace("ocr_page", settings.OCR_CACHE_TTL, settings.OCR_CACHE_MAX_BYTES)
+
+# Shared OCR process pool: one per API process, capped by OCR_MAX_WORKERS so
+# concurrent requests queue for CPU instead of oversubscribing it
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Get or create the OCR process pool (singleton)"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=settings.OCR_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _ocr_pool
+
+def _warm_worker() -> int:
+    """Import the OCR modules in a pool worker ahead of its first page"""
+    import fitz  # PyMuPDF
+    import pytesseract
+    return os.getpid()
+
+def warm_ocr_pool() -> int:
+    """Start all OCR worker processes now (spawning a worker and importing PyMuPDF
+    and pytesseract in it takes about a second); returns the number of workers started"""
+    pool = get_ocr_pool()
+    futures = [pool.submit(_warm_worker) for _ in range(settings.OCR_MAX_WORKERS)]
+    return len({future.result() for future in futures})
+
+def render_page(page, dpi: int, grayscale: bool, binarize: bool) -> "Image.Image":
+    """Rasterize a PDF page for OCR.
+    Grayscale pixmaps use a third of the memory of RGB ones; binarization
+    (black/white) shrinks them further and helps on noisy scans.
+    """
+    import fitz  # PyMuPDF
+    from PIL import Image
+    colorspace = fitz.csGRAY if grayscale or binarize else fitz.csRGB
+    pix = page.get_pixmap(dpi=dpi, colorspace=colorspace)
+    mode = "L" if colorspace is fitz.csGRAY else "RGB"
+    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+    if binarize:
+        threshold = settings.OCR_BINARIZE_THRESHOLD
+        img = img.point(lambda p: 255 if p > threshold else 0, mode="1")
+    return img
+
+def page_fingerprint(doc, page, options) -> str:
+    """Content hash of a page: its drawing instructions plus the raw streams of its images.
+    Independent of the rest of the document, so a page reused in another report
+    (letterhead, methodology, annexes) gets the same fingerprint.
+    """
+    h = hashlib.blake2b(repr(options).encode(), digest_size=20)
+    h.update(page.read_contents())
+    for image in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(image[0]) or b"")
+    return h.hexdigest()
+
+def recognize_page(page, dpi: int, grayscale: bool, binarize: bool, lang: str) -> str:
+    """Render and recognize one page of an open document"""
+    try:
+        import pytesseract
+    except ImportError as e:
+        raise RuntimeError("Scanned pages need the OCR dependencies: pip install -r requirements/ocr.txt") from e
+    tesseract_cmd = os.getenv("TESSERACT_CMD")
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    img = render_page(page, dpi, grayscale, binarize)
+    return pytesseract.image_to_string(img, lang=lang)
+
+def ocr_page(page_pdf: bytes, dpi: int, grayscale: bool, binarize: bool, lang: str) -> str:
+    """Recognize a single-page PDF (module-level so it can run in the process pool;
+    workers receive only their page, not the whole document or a file path)"""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=page_pdf, filetype="pdf") as doc:
+        return recognize_page(doc[0], dpi, grayscale, binarize, lang)
+
+def _single_page_pdf(doc, page_num: int) -> bytes:
+    import fitz  # PyMuPDF
+    with fitz.open() as page_doc:
+        page_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
+        return page_doc.tobytes()
+
+def open_pdf(pdf):
+    """Open a PDF from memory (bytes) or from a file path"""
+    import fitz  # PyMuPDF
+    if isinstance(pdf, str):
+        return fitz.open(pdf)
+    return fitz.open(stream=pdf, filetype="pdf")
 
 class OcrAgent:
-    def extract_text(self, pdf_path: str) -> str:
-        """Extract text from PDF using PyMuPDF, fallback to OCR if needed"""
-        tesseract_cmd = os.getenv("TESSERACT_CMD")
-        if tesseract_cmd:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-
-        text = ""
-        doc = fitz.open(pdf_path)
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
+    def extract_text(self, pdf) -> str:
+        """Extract text from PDF using PyMuPDF, fallback to OCR if needed.
+        `pdf` is the document content (bytes, opened in memory) or a file path.
+        Scanned pages are recognized concurrently in the OCR process pool
+        (OCR_MODE=process) and reassembled in page order. Pages already
+        recognized (same content, same OCR options) come from ocr_page_cache.
+        """
+        options = (settings.OCR_DPI, settings.OCR_GRAYSCALE, settings.OCR_BINARIZE, os.getenv("OCR_LANGUAGE", "fra"))
+
+        with open_pdf(pdf) as doc:
             # Try to extract text directly first
-            page_text = page.get_text()
-            
-            # If no text found (scanned PDF), use OCR
-            if not page_text.strip():
-                pix = page.get_pixmap()
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                page_text = pytesseract.image_to_string(img, lang=os.getenv("OCR_LANGUAGE", "fra"))
-            
-            text += page_text + "\n"
-        
-        doc.close()
-        return text
+            pages = [doc[page_num].get_text() for page_num in range(len(doc))]
+
+            # If no text found (scanned PDF), use OCR unless the page is cached
+            fingerprints = {}
+            for page_num, page_text in enumerate(pages):
+                if not page_text.strip():
+                    fingerprint = page_fingerprint(doc, doc[page_num], options)
+                    cached_text = ocr_page_cache.get(fingerprint)
+                    if cached_text is not None:
+                        pages[page_num] = cached_text
+                    else:
+                        fingerprints[page_num] = fingerprint
+
+            # Identical pages within the document are recognized once
+            scanned = {}
+            for page_num, fingerprint in fingerprints.items():
+                scanned.setdefault(fingerprint, page_num)
+            recognized = {}
+            if settings.OCR_MODE == "process" and len(scanned) > 1:
+                pool = get_ocr_pool()
+                futures = {
+                    fp: pool.submit(ocr_page, _single_page_pdf(doc, page_num), *options)
+                    for fp, page_num in scanned.items()
+                }
+                for fingerprint, future in futures.items():
+                    recognized[fingerprint] = future.result()
+            else:
+                for fingerprint, page_num in scanned.items():
+                    recognized[fingerprint] = recognize_page(doc[page_num], *options)
+
+        for fingerprint, page_text in recognized.items():
+            ocr_page_cache.set(fingerprint, page_text)
+        for page_num, fingerprint in fingerprints.items():
+            pages[page_num] = recognized[fingerprint]
+
+        # Pages stay identifiable for chunked extraction of long reports
+        return PAGE_SEPARATOR.join(page_text + "\n" for page_text in pages)
@@ -1,13 +1,39 @@
 # app/agents/orchestrator_agent.py
-import tempfile
-import json
+import asyncio
 import threading
+import json
+import time
 from app.agents.ocr_agent import OcrAgent
 from app.agents.extractorAgent import ExtractorAgent
 from app.agents.analyzerAgent import AnalyzerAgent
 from app.agents.recommenderAgent import RecommenderAgent
 from app.agents.summarizerAgent import SummarizerAgent
+from app.core.cache import cache, canonical_hash
+from app.core.config import settings
+from app.core.log import get_logger, save_debug_artifact
+from app.core.metrics import PIPELINE_DURATION, PIPELINES_IN_FLIGHT, STAGE_DURATION
+from app.core.pipeline import Pipeline, PipelineHalt, Stage
 from app.core.translations import get_translation, translate_parameter_name
+from app.core.utils import clean_text
+
+logger = get_logger(__name__)
+
+# Stages reported through the `progress` callback of OrchestratorAgent.run
+PIPELINE_STAGES = ["ocr", "extraction", "analysis", "recommendations", "summaries"]
+
+# Reuse orchestrator instance to avoid recreating agents on every request
+_orchestrator = None
+_orchestrator_lock = threading.Lock()
+
+def get_orchestrator():
+    """Get or create orchestrator instance (singleton pattern).
+    Built at startup (see app/core/startup.py); blocking until then, as it opens Chroma.
+    """
+    global _orchestrator
+    with _orchestrator_lock:
+        if _orchestrator is None:
+            _orchestrator = OrchestratorAgent()
+        return _orchestrator
 
 class OrchestratorAgent:
     def __init__(self):
@@ -16,7 +42,33 @@ class OrchestratorAgent:
         self.analyzer = AnalyzerAgent()
         self.recommender = RecommenderAgent()
         self.summarizer = SummarizerAgent()
+        # LLM outputs memoized on a canonical hash of each stage's actual inputs
+        self.stage_caches = {
+            stage: cache.namespace(f"stage_{stage}", settings.STAGE_CACHE_TTL, settings.STAGE_CACHE_MAX_BYTES)
+            for stage in ("analysis", "recommendations", "summary")
+        }
+
+    async def _memoized(self, stage: str, inputs: list, compute):
+        """Return the cached output of `stage` for these inputs, or compute and store it.
+        Failures are not cached: `compute` raising propagates without a store.
+        """
+        namespace = self.stage_caches[stage]
+        key = canonical_hash(settings.MODEL_NAME, *inputs)
+        cached = await asyncio.to_thread(namespace.get, key)
+        if cached is not None:
+            return cached
+        result = await compute()
+        await asyncio.to_thread(namespace.set, key, result)
+        return result
     
+    @staticmethod
+    def _text_key(text: str, language: str):
+        """Second-level report key: the extracted text, whitespace-normalized, so the same
+        report re-exported by another PDF producer (other bytes, metadata, timestamps)
+        shares the cached result. None when there is no text to key on."""
+        text = clean_text(text)
+        return cache._generate_key("report_text", canonical_hash(text, language)) if text else None
+
     def _format_parameters(self, params: dict, language: str = "fr") -> str:
         """Format parameters as a readable table with one row per parameter.
         - Merges keys ending with ' Min'/' Max' into a single range.
@@ -191,64 +243,182 @@ class OrchestratorAgent:
 
         return out
 
-    def run(self, file, language="fr"):
-        """Pipeline complet d'analyse"""
-        import time
-        start_time = time.time()
-        self.language = language
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file.file.read())
-            tmp_path = tmp.name
-
-        # 1️⃣ Lecture PDF
-        ocr_start = time.time()
-        text = self.ocr.extract_text(tmp_path)
-        ocr_time = time.time() - ocr_start
-        print(f"\n=== TEXTE EXTRAIT ({len(text)} caractères) ===")
-        print(text[:1000])  # Print first 1000 chars for debugging
-        print("\n=== FIN EXTRAIT ===")
-        
-        # Save to debug file for inspection
-        import os
-        debug_dir = "app/data/debug"
-        os.makedirs(debug_dir, exist_ok=True)
-        with open(f"{debug_dir}/extracted_text.txt", "w", encoding="utf-8") as f:
-            f.write(text)
+    async def run(self, file, language="fr", progress=None, on_event=None):
+        """Pipeline complet d'analyse (async: les appels LLM ne bloquent pas la boucle d'événements)
+
+        The steps form a small dependency graph (see `Pipeline`): each stage starts
+        as soon as its inputs are ready, e.g. the knowledge-base retrieval runs while
+        the analysis is being generated.
+
+        `file` is either an UploadFile-like object or the raw PDF bytes.
+        `progress`, if given, is called as progress(stage, status) with status
+        "running" or "done" for each stage of PIPELINE_STAGES.
+        `on_event`, if given, is called as on_event(event, data) as soon as each
+        report section is ready ("parameters", "analysis", "recommendations",
+        "summary"), and with "token" events while LLM sections are generated.
+        """
+        def mark(stage, status):
+            if progress:
+                progress(stage, status)
+
+        def emit(event, data):
+            if on_event:
+                on_event(event, data)
+
+        def token_sink(section):
+            """Forward streamed LLM tokens of a section, or None to disable streaming."""
+            if on_event is None:
+                return None
+            return lambda delta: on_event("token", {"section": section, "delta": delta})
+
+        canonical = {}  # "key" of the extracted text and, on a hit, the cached "report"
+
+        # 1️⃣ Lecture PDF (CPU-bound: PyMuPDF + Tesseract run in a worker thread)
+        async def ocr(content):
+            mark("ocr", "running")
+            # Opened from memory: no temporary file
+            text = await asyncio.to_thread(self.ocr.extract_text, content)
+            mark("ocr", "done")
+            logger.info("Texte extrait: %d caractères", len(text))
+            logger.debug("Début du texte extrait: %s", text[:1000])
+            await asyncio.to_thread(save_debug_artifact, "ocr_text", text)
+            canonical["key"] = self._text_key(text, language)
+            if canonical["key"]:
+                cached = await asyncio.to_thread(cache.get, canonical["key"])
+                if cached:
+                    # Same text as an already analyzed report: skip extraction and the LLM stages
+                    canonical["report"] = cached
+                    raise PipelineHalt("same text as a cached report")
+            return text
 
         # 2️⃣ Extraction paramètres
-        extract_start = time.time()
-        raw_parameters = self.extractor.extract_parameters(text)
-        extract_time = time.time() - extract_start
-        print(f"\n=== PARAMÈTRES EXTRAITS (BRUT) ===")
-        print(raw_parameters)
-        print("\n=== FIN PARAMÈTRES ===")
+        async def extraction(ocr):
+            mark("extraction", "running")
+            raw_parameters = await self.extractor.extract_parameters(ocr)
+            mark("extraction", "done")
+            logger.debug("Paramètres extraits (brut): %s", raw_parameters)
+            await asyncio.to_thread(
+                save_debug_artifact, "extraction", json.dumps(raw_parameters, ensure_ascii=False, indent=2)
+            )
+            return raw_parameters
 
-        # Normalize into clean structure with merged ranges
-        parameters = self._normalize_parameters(raw_parameters if isinstance(raw_parameters, dict) else {})
+        async def normalize(extraction):
+            # Normalize into clean structure with merged ranges
+            parameters = self._normalize_parameters(extraction if isinstance(extraction, dict) else {})
+            # Format parameters as readable table
+            emit("parameters", {"parameters": parameters, "table": self._format_parameters(parameters, language)})
+            if not parameters:
+                # Nothing to interpret: skip the analysis, recommendation and summary LLM calls
+                reason = extraction.get("error") or extraction.get("texte_brut") if isinstance(extraction, dict) else None
+                raise PipelineHalt(reason or get_translation("no_parameters", language))
+            return parameters
 
         # 3️⃣ Interprétation agronomique
-        analyze_start = time.time()
-        analysis = self.analyzer.interpret(parameters, language=language)
-        analyze_time = time.time() - analyze_start
-
-        # 4️⃣ Recommandations + fiches cultures
-        import json as _json
-        recommend_start = time.time()
-        recommendations = self.recommender.recommend(_json.dumps(parameters, ensure_ascii=False), analysis, language=language)
-        recommend_time = time.time() - recommend_start
-        
-        total_time = time.time() - start_time
+        async def analysis(normalize):
+            mark("analysis", "running")
+            result = await self._memoized(
+                "analysis", [normalize, language],
+                lambda: self.analyzer.interpret(normalize, language=language, on_token=token_sink("analysis"))
+            )
+            mark("analysis", "done")
+            emit("analysis", {"content": result})
+            return result
+
+        # 4️⃣ Recommandations + fiches cultures (retrieval only needs the parameters)
+        async def retrieval(normalize):
+            return await self.recommender.retrieve(normalize)
+
+        async def recommendations(normalize, analysis, retrieval):
+            mark("recommendations", "running")
+            result = await self._memoized(
+                "recommendations", [normalize, analysis, retrieval, language],
+                lambda: self.recommender.recommend(
+                    json.dumps(normalize, ensure_ascii=False), analysis, language=language,
+                    on_token=token_sink("recommendations"), context=retrieval
+                )
+            )
+            mark("recommendations", "done")
+            emit("recommendations", {"content": result})
+            return result
+
+        # 5. Summaries for other languages (Wolof and Bambara run concurrently)
+        async def summarize(lang, analysis, recommendations):
+            mark("summaries", "running")
+            full_text = analysis + "\n\n" + recommendations
+            try:
+                summary = await self._memoized(
+                    "summary", [full_text, lang],
+                    lambda: self.summarizer.summarize(full_text, lang, on_token=token_sink(f"summary_{lang}"))
+                )
+            except Exception as e:
+                logger.warning("Error summarizing for %s: %s", lang, e)
+                summary = f"Erreur lors de la génération du résumé {lang}."
+            emit("summary", {"language": lang, "content": summary})
+            return summary
+
+        async def summary_wo(analysis, recommendations):
+            return await summarize("wo", analysis, recommendations)
+
+        async def summary_bm(analysis, recommendations):
+            return await summarize("bm", analysis, recommendations)
+
+        pipeline = Pipeline([
+            Stage("ocr", ocr, ["content"]),
+            Stage("extraction", extraction, ["ocr"]),
+            Stage("normalize", normalize, ["extraction"]),
+            Stage("analysis", analysis, ["normalize"]),
+            Stage("retrieval", retrieval, ["normalize"]),
+            Stage("recommendations", recommendations, ["normalize", "analysis", "retrieval"]),
+            Stage("summary_wo", summary_wo, ["analysis", "recommendations"]),
+            Stage("summary_bm", summary_bm, ["analysis", "recommendations"]),
+        ])
+        content = file if isinstance(file, bytes) else file.file.read()
+        started = time.perf_counter()
+        try:
+            with PIPELINES_IN_FLIGHT.track_inprogress():
+                results, trace = await pipeline.run(content=content)
+        except Exception:
+            PIPELINE_DURATION.observe(time.perf_counter() - started, outcome="error")
+            raise
+        durations = {name: t["duration"] for name, t in trace["stages"].items()}
+        for name, duration in durations.items():
+            STAGE_DURATION.observe(duration, stage=name)
+        PIPELINE_DURATION.observe(trace["total"], outcome="halted" if trace["halted"] else "complete")
+        timings = {
+            "total": round(trace["total"], 3),
+            "stages": {name: round(d, 3) for name, d in durations.items()},
+            "critical_path": trace["critical_path"],
+        }
+
+        if "report" in canonical:
+            for stage in ("extraction", "analysis", "recommendations", "summaries"):
+                mark(stage, "skipped")
+            logger.info("Texte identique à un rapport en cache (%.1fs)", trace["total"])
+            return canonical["report"]
+
+        if trace["halted"]:
+            for stage in ("analysis", "recommendations", "summaries"):
+                mark(stage, "skipped")
+            logger.info("Pipeline arrêté après '%s' (%.1fs): aucun paramètre extrait", trace["halted"], trace["total"])
+            report = self._empty_report(results.get("extraction"), language, trace["total"], timings)
+            await self._store_canonical(canonical.get("key"), report)
+            return report
+
+        mark("summaries", "done")
+        logger.info(
+            "Pipeline %.1fs, chemin critique: %s", trace["total"], " → ".join(trace["critical_path"]),
+            extra={"timings": timings}
+        )
 
         # Format parameters as readable table
-        params_formatted = self._format_parameters(parameters, language)
+        params_formatted = self._format_parameters(results["normalize"], language)
 
         # Build the final formatted report string
         report_str = f"""
 # 🧾 {get_translation('report_title', language)}
 
 ---
-**⏱️ {get_translation('analysis_time', language)}:** {total_time:.1f}s (OCR: {ocr_time:.1f}s | Extraction: {extract_time:.1f}s | Analyse: {analyze_time:.1f}s | Recommandations: {recommend_time:.1f}s)
+**⏱️ {get_translation('analysis_time', language)}:** {trace['total']:.1f}s (OCR: {durations['ocr']:.1f}s | Extraction: {durations['extraction']:.1f}s | Analyse: {durations['analysis']:.1f}s | Recommandations: {durations['recommendations']:.1f}s)
 
 ---
 
@@ -256,41 +426,53 @@ class OrchestratorAgent:
 {params_formatted}
 
 ## 🌿 {get_translation('interpretation_title', language)}
-{analysis}
+{results['analysis']}
 
 ## 🌾 {get_translation('recommendations_title', language)}
-{recommendations}
+{results['recommendations']}
 """
 
-        # 5. Generate summaries for other languages in parallel
-        full_text = analysis + "\n\n" + recommendations
-        summaries = {}
+        # Return everything in one payload
+        report = {
+            "report": report_str,
+            "summary_wo": results.get("summary_wo", "Résumé Wolof non disponible."),
+            "summary_bm": results.get("summary_bm", "Résumé Bambara non disponible."),
+            "timings": timings,
+        }
+        await self._store_canonical(canonical.get("key"), report)
+        return report
 
-        def run_summarizer(lang):
-            """Target function for threading to get summary."""
-            try:
-                summaries[lang] = self.summarizer.summarize(full_text, lang)
-            except Exception as e:
-                print(f"Error summarizing for {lang}: {e}")
-                summaries[lang] = f"Erreur lors de la génération du résumé {lang}."
+    @staticmethod
+    async def _store_canonical(key, report: dict):
+        """Cache the report under its text key too (failed extractions are not cached)"""
+        if key and not report.get("error"):
+            await asyncio.to_thread(cache.set, key, report)
+
+    def _empty_report(self, extraction, language, total, timings) -> dict:
+        """Report for a document without extractable parameters (no analysis was run).
+        "error" is set when the extraction itself failed, so the result is not cached.
+        """
+        error = extraction.get("error") if isinstance(extraction, dict) else None
+        detail = error or get_translation("extraction_failed", language)
+        report_str = f"""
+# 🧾 {get_translation('report_title', language)}
 
-        # Create and start threads for Wolof and Bambara summaries
-        thread_wo = threading.Thread(target=run_summarizer, args=('wo',))
-        thread_bm = threading.Thread(target=run_summarizer, args=('bm',))
-        
-        thread_wo.start()
-        thread_bm.start()
+---
+**⏱️ {get_translation('analysis_time', language)}:** {total:.1f}s
 
-        # Wait for both summarization threads to complete
-        thread_wo.join()
-        thread_bm.join()
+---
 
-        summary_wo = summaries.get('wo', "Résumé Wolof non disponible.")
-        summary_bm = summaries.get('bm', "Résumé Bambara non disponible.")
+## 🔍 {get_translation('parameters_title', language)}
+{get_translation('no_parameters', language)}
 
-        # Return everything in one payload
-        return {
+⚠️ {detail}
+"""
+        result = {
             "report": report_str,
-            "summary_wo": summary_wo,
-            "summary_bm": summary_bm
+            "summary_wo": "Résumé Wolof non disponible.",
+            "summary_bm": "Résumé Bambara non disponible.",
+            "timings": timings,
         }
+        if error:
+            result["error"] = error
+        return result
@@ -1,22 +1,50 @@
 # app/agents/recommenderAgent.py
-from app.agents.baseAgent import get_openai_client
-from app.core.vector_store import VectorStore
+from app.core.llm_gateway import get_llm_gateway
+from app.core.log import get_logger
+from app.core.retrieval import facet_query, facet_tags, soil_facets
+from app.core.utils import truncate_to_tokens
+from app.core.vector_store import get_vector_store
 from app.core.config import settings
 
+logger = get_logger(__name__)
+
 class RecommenderAgent:
     def __init__(self):
-        self.client = get_openai_client()  # Reuse shared client
-        self.vstore = VectorStore()
+        self.llm = get_llm_gateway()
+        try:
+            self.vstore = get_vector_store()  # Shared with the /docs routes
+        except ImportError:
+            logger.warning("chromadb not installed, recommendations without knowledge base (requirements/vector.txt)")
+            self.vstore = None
+
+    async def retrieve(self, soil_data) -> str:
+        """Returns the knowledge-base context for these soil parameters (normalized dict, or text).
+        Only depends on the parameters, so it can run while the analysis is generated.
+        Chunks are filtered on the profile's facets (pH, texture, salinity, deficiencies)
+        and ranked by vector + keyword fusion; the context is capped at RETRIEVAL_CONTEXT_TOKENS.
+        """
+        if self.vstore is None:
+            return "Aucun document disponible."
+        if isinstance(soil_data, dict):
+            facets = soil_facets(soil_data)
+            query, tags = facet_query(facets, soil_data), facet_tags(facets)
+            logger.debug("Facettes du sol: %s", facets)
+        else:
+            query, tags = soil_data, []
+        docs = await self.vstore.hybrid_query(query, n=settings.RETRIEVAL_TOP_K, tags=tags)
+        if not docs:
+            return "Aucun document disponible."
+        return truncate_to_tokens("\n---\n".join(docs), settings.RETRIEVAL_CONTEXT_TOKENS)
 
-    def recommend(self, soil_data: str, analysis: str, language: str = "fr"):
+    async def recommend(self, soil_data: str, analysis: str, language: str = "fr", on_token=None, context: str = None):
         """Generates recommendations in the requested language."""
         system_prompt = (
             "Tu es un conseiller agricole expert en sciences du sol. Tu connais particulièrement bien les cultures et les sols africains. "
             "Génère des recommandations EN FRANÇAIS: (1) Corrections du sol (amendements, doses), (2) Cultures recommandées (exigences, fertilisation, saison)."
         )
         
-        docs, _ = self.vstore.query(soil_data, n=3)
-        context = "\n".join(docs[0]) if docs else "Aucun document disponible."
+        if context is None:
+            context = await self.retrieve(soil_data)
         
         user_prompt = f"""
 CONTEXTE:
@@ -43,12 +71,12 @@ Produis des recommandations claires et actionnables en suivant EXACTEMENT cette
   NB: les exemples fournis vise à te guider, mais tu dois adapter les recommandations en fonction des données fournies.
 """
         
-        response = self.client.chat.completions.create(
+        return await self.llm.chat(
+            on_token=on_token,
             model=settings.MODEL_NAME,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0.4
-        )
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        )
\ No newline at end of file
@@ -1,12 +1,12 @@
 # app/agents/summarizerAgent.py
-from app.agents.baseAgent import get_openai_client
+from app.core.llm_gateway import get_llm_gateway
 from app.core.config import settings
 
 class SummarizerAgent:
     def __init__(self):
-        self.client = get_openai_client()  # Reuse shared client
+        self.llm = get_llm_gateway()
 
-    def summarize(self, text_to_summarize: str, target_language: str) -> str:
+    async def summarize(self, text_to_summarize: str, target_language: str, on_token=None) -> str:
         """Summarizes the given text into the target language (Wolof or Bambara) using OpenAI."""
         
         system_prompts = {
@@ -37,7 +37,8 @@ TEXTE À RÉSUMER:
 RÉSUMÉ CONCIS EN {target_language.upper()}:
         """
         
-        response = self.client.chat.completions.create(
+        return await self.llm.chat(
+            on_token=on_token,
             model=settings.MODEL_NAME,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -45,6 +46,4 @@ RÉSUMÉ CONCIS EN {target_language.upper()}:
             ],
             temperature=0.2,
             max_tokens=500
-        )
-        
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        )
\ No newline at end of file
@@ -0,0 +1,73 @@
+# app/bench_startup.py
+"""Startup import benchmark: `python -m app.bench_startup [--runs N] [--max-seconds S]`
+
+Imports app.main in fresh interpreters with `python -X importtime` and reports
+its import time (median of the runs) and the heaviest top-level packages.
+Exits with status 1 when the median exceeds --max-seconds, or when a module
+that must stay lazy (LAZY_MODULES) is imported at boot, so a regression can
+fail CI. Redis is disabled (REDIS_HOST="") to measure the imports alone.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+# Loaded on first use (warm-up or first request), never while importing app.main
+LAZY_MODULES = ("chromadb", "fitz", "pymupdf", "pytesseract", "PIL", "pandas", "openai", "redis",
+                "sentence_transformers", "tiktoken")
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def measure() -> tuple:
+    """(app.main cumulative seconds, self seconds per top-level package) of one fresh import"""
+    env = {**os.environ, "REDIS_HOST": "", "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    total, packages = 0.0, Counter()
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = int(match[1]), int(match[2]), match[3]
+        packages[name.split(".")[0]] += self_us / 1e6
+        if name == "app.main":
+            total = cumulative_us / 1e6
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="packages listed")
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail above this median import time")
+    args = parser.parse_args()
+
+    measure()  # warm the OS file cache (and write .pyc files of the first run out of the way)
+    runs = [measure() for _ in range(max(1, args.runs))]
+    median = statistics.median(total for total, _ in runs)
+    packages = runs[-1][1]
+
+    print(f"import app.main: median {median:.3f}s over {len(runs)} runs "
+          f"(min {min(t for t, _ in runs):.3f}s, max {max(t for t, _ in runs):.3f}s)")
+    for name, seconds in packages.most_common(args.top):
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = sorted(name for name in packages if name in LAZY_MODULES)
+    if eager:
+        print(f"FAIL: imported at boot but expected lazy: {', '.join(eager)}")
+        failed = True
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"FAIL: median import time {median:.3f}s > {args.max_seconds:.3f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
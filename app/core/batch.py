@@ -0,0 +1,153 @@
+# app/core/batch.py
+"""Batch analysis of several soil reports (POST /analyze/batch).
+
+- Uploads are PDFs or zip archives of PDFs (expanded here).
+- Identical documents are analyzed once (same cache key) and reports already
+  in the cache are returned without running the pipeline.
+- The other reports run concurrently, BATCH_CONCURRENCY at a time: OCR shares
+  the process pool and every LLM call goes through the gateway limits, so
+  throughput follows the provider rate limit instead of the upload order.
+- Results are yielded as soon as each report is done.
+"""
+import asyncio
+import io
+import os
+import time
+import zipfile
+from collections import Counter
+from typing import AsyncIterator, List, Tuple
+
+from app.core.cache import cache, content_hash
+from app.core.config import settings
+from app.core.jobs import run_report
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchError(ValueError):
+    """The batch cannot be processed at all (too many documents, too large once decompressed)"""
+
+
+def _is_pdf(content: bytes) -> bool:
+    return b"%PDF-" in content[:1024]
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int):
+    """Content of a zip member, or None as soon as more than `max_bytes` were decompressed
+    (the size declared in the zip header is not trusted)"""
+    chunks, size = [], 0
+    with archive.open(info) as member:
+        while chunk := member.read(settings.UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def expand_uploads(uploads: List[Tuple[str, bytes, str]]) -> List[dict]:
+    """One item per document: {"file", "content", "file_hash"} or {"file", "error"}.
+    Zip archives are replaced by their PDF members ("archive.zip/member.pdf"). Blocking.
+    Raises BatchError past BATCH_MAX_FILES documents or BATCH_MAX_BYTES of accepted content
+    (decompressed bytes actually read).
+    """
+    items = []
+    total = 0
+    too_large = BatchError(f"Lot trop volumineux une fois décompressé (maximum {settings.BATCH_MAX_BYTES // (1024 * 1024)} Mo).")
+
+    def add(item):
+        if len(items) >= settings.BATCH_MAX_FILES:
+            raise BatchError(f"Trop de documents dans le lot (maximum {settings.BATCH_MAX_FILES}).")
+        items.append(item)
+
+    for filename, content, file_hash in uploads:
+        if content[:4] != b"PK\x03\x04":
+            total += len(content)
+            if total > settings.BATCH_MAX_BYTES:
+                raise too_large
+            add({"file": filename, "content": content, "file_hash": file_hash} if _is_pdf(content)
+                else {"file": filename, "error": "Format non supporté (PDF ou zip attendu)."})
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                for info in archive.infolist():
+                    base = os.path.basename(info.filename)
+                    if info.is_dir() or info.filename.startswith("__MACOSX/") or base.startswith("."):
+                        continue
+                    name = f"{filename}/{info.filename}"
+                    if not base.lower().endswith(".pdf"):
+                        add({"file": name, "error": "Format non supporté (PDF attendu)."})
+                    elif info.file_size > settings.MAX_UPLOAD_BYTES:
+                        # Checked before decompressing (zip bombs)
+                        add({"file": name, "error": "Fichier trop volumineux."})
+                    else:
+                        limit = min(settings.MAX_UPLOAD_BYTES, settings.BATCH_MAX_BYTES - total)
+                        content = _read_member(archive, info, limit)
+                        if content is None:
+                            if limit < settings.MAX_UPLOAD_BYTES:
+                                raise too_large
+                            add({"file": name, "error": "Fichier trop volumineux."})
+                            continue
+                        total += len(content)
+                        add({"file": name, "content": content, "file_hash": content_hash(content)})
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            add({"file": filename, "error": f"Archive zip illisible: {e}"})
+    return items
+
+
+async def run_batch(items: List[dict]) -> AsyncIterator[dict]:
+    """Yield {"event": "result", "index", "file", "status", "report" | "error"} per document
+    as it completes, then {"event": "summary", ...}.
+    status: "cached", "done", "duplicate" (same content as `duplicate_of`) or "error".
+    """
+    started = time.perf_counter()
+    counts = Counter()
+    groups = {}  # cache key -> indexes of the identical documents
+
+    for index, item in enumerate(items):
+        if "error" in item:
+            counts["error"] += 1
+            yield {"event": "result", "index": index, "file": item["file"], "status": "error", "error": item["error"]}
+        else:
+            groups.setdefault(cache._generate_key("report", item["file_hash"]), []).append(index)
+
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_CONCURRENCY))
+
+    async def process(cache_key, indexes):
+        """(indexes, status, report, error message) of one distinct document"""
+        try:
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached:
+                return indexes, "cached", cached, None
+            async with semaphore:
+                report = await run_report(items[indexes[0]]["content"], cache_key)
+            return indexes, "error" if report.get("error") else "done", report, None
+        except Exception as e:
+            logger.exception("Batch analysis of %s failed: %s", items[indexes[0]]["file"], e)
+            return indexes, "error", None, str(e)
+
+    tasks = [asyncio.create_task(process(key, indexes)) for key, indexes in groups.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, status, report, error = await next_done
+            first = items[indexes[0]]["file"]
+            for position, index in enumerate(indexes):
+                entry = {"event": "result", "index": index, "file": items[index]["file"]}
+                if position > 0:
+                    entry.update(status="duplicate", duplicate_of=first)
+                    counts["duplicate"] += 1
+                else:
+                    entry["status"] = status
+                    counts[status] += 1
+                if report is None:
+                    entry["error"] = error
+                else:
+                    entry["report"] = report
+                yield entry
+    finally:
+        # Client went away: stop the reports nobody will receive
+        for task in tasks:
+            task.cancel()
+
+    yield {"event": "summary", "files": len(items), **counts, "seconds": round(time.perf_counter() - started, 3)}
@@ -1,33 +1,138 @@
 # app/core/cache.py
 import json
 import hashlib
-from typing import Optional, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
 import os
 
-# Try to import Redis, fallback to in-memory cache
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
-
+from app.core.codec import Codec
 from app.core.config import settings
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+HEX_DIGEST = re.compile(r"[0-9a-f]{32,128}")
+
+def content_hasher():
+    """Incremental hash of document bytes (BLAKE2b: faster than MD5 on 64-bit CPUs, no dependency)"""
+    return hashlib.blake2b(digest_size=16)
+
+def content_hash(data: bytes) -> str:
+    """Hex digest of document bytes, see content_hasher"""
+    hasher = content_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+def canonical_hash(*parts) -> str:
+    """Stable hash of JSON-serializable inputs: dict key order and whitespace don't matter"""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=20).hexdigest()
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache bounded by size in bytes, with a TTL per entry.
+
+    Stores Python objects as-is (no serialization on hits); callers pass the
+    serialized size so the budget reflects what the values really weigh.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: int):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.size = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _drop(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, _, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[int] = None) -> bool:
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, size, expires_at)
+            self.size += size
+            if self.size > self.max_bytes:
+                # Expired entries go first, then the least recently used ones
+                now = time.monotonic()
+                for expired in [k for k, (_, _, exp) in self.entries.items() if exp <= now]:
+                    self._drop(expired)
+                while self.size > self.max_bytes:
+                    self._drop(next(iter(self.entries)))
+                    self.evictions += 1
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+                return True
+            return False
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "evictions": self.evictions}
 
 class Cache:
-    """Cache system with Redis backend and in-memory fallback"""
+    """Cache system with Redis backend and in-memory fallback.
+
+    The in-memory tier (MemoryCache) is the whole cache when Redis is absent,
+    and an L1 in front of Redis otherwise: hot entries skip the network
+    round-trip and the JSON decode.
+    """
     
     def __init__(self):
         self.redis_client = None
-        self.memory_cache = {}  # Fallback in-memory cache
+        # Fallback in-memory cache, also used as L1 in front of Redis
+        self.memory_cache = MemoryCache(settings.CACHE_MEMORY_MAX_BYTES, settings.REDIS_TTL)
+        self.namespaces = {}  # Dedicated cache areas (see namespace())
+        self.hits = 0
+        self.misses = 0
+        # Binary encoding of the values stored in Redis (compression + format marker)
+        self.codec = Codec(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            level=settings.CACHE_COMPRESSION_LEVEL,
+            min_size=settings.CACHE_COMPRESS_MIN_BYTES
+        )
         
-        if REDIS_AVAILABLE and settings.REDIS_HOST:
+        if settings.REDIS_HOST:
             try:
+                # Imported only when configured; without the package, fall back to in-memory cache
+                import redis
                 # Support for Redis URL format (e.g., from Render or Upstash)
                 if settings.REDIS_HOST.startswith("redis://") or settings.REDIS_HOST.startswith("rediss://"):
                     # Use URL format
                     self.redis_client = redis.from_url(
                         settings.REDIS_HOST,
-                        decode_responses=True,
+                        decode_responses=False,
                         socket_connect_timeout=2,
                         socket_timeout=2
                     )
@@ -37,70 +142,117 @@ class Cache:
                         host=settings.REDIS_HOST,
                         port=settings.REDIS_PORT,
                         password=settings.REDIS_PASSWORD,
-                        decode_responses=True,
+                        decode_responses=False,
                         socket_connect_timeout=2,
                         socket_timeout=2
                     )
                 # Test connection
                 self.redis_client.ping()
-                print("✅ Redis cache connected")
+                logger.info("Redis cache connected")
             except Exception as e:
-                print(f"⚠️ Redis not available, using in-memory cache: {e}")
+                logger.warning("Redis not available, using in-memory cache: %s", e)
                 self.redis_client = None
     
     @staticmethod
     def _generate_key(prefix: str, *args) -> str:
-        """Generate cache key from prefix and arguments"""
+        """Generate cache key from prefix and arguments.
+        A single digest (content_hash, canonical_hash) is used as-is instead of being hashed again.
+        """
+        if len(args) == 1 and isinstance(args[0], str) and HEX_DIGEST.fullmatch(args[0]):
+            return f"{prefix}:{args[0]}"
         key_str = ":".join(str(arg) for arg in args)
-        key_hash = hashlib.md5(key_str.encode()).hexdigest()
+        key_hash = hashlib.blake2b(key_str.encode(), digest_size=16).hexdigest()
         return f"{prefix}:{key_hash}"
+
+    def _l1_ttl(self, ttl: int) -> int:
+        """TTL of an entry in the memory tier: shortened when it only mirrors Redis,
+        so deletions made by other workers are picked up quickly."""
+        return min(ttl, settings.CACHE_L1_TTL) if self.redis_client else ttl
+
+    def _count(self, hit: bool):
+        with self.memory_cache.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        value = self.memory_cache.get(key)
+        if value is not None:
+            self._count(True)
+            return value
+
         if self.redis_client:
             try:
-                value = self.redis_client.get(key)
-                if value:
-                    return json.loads(value)
+                # Value and remaining TTL in a single round-trip
+                pipe = self.redis_client.pipeline()
+                pipe.get(key)
+                pipe.ttl(key)
+                data, ttl = pipe.execute()
+                if data:
+                    # Raw serialized size, as in set(): the L1 budget counts what values weigh in memory
+                    value, size = self.codec.decode_sized(data)
+                    ttl = ttl if ttl and ttl > 0 else settings.REDIS_TTL
+                    self.memory_cache.set(key, value, size, self._l1_ttl(ttl))
+                    self._count(True)
+                    return value
             except Exception as e:
-                print(f"⚠️ Redis get error: {e}")
-        
-        # Fallback to memory cache
-        return self.memory_cache.get(key)
+                logger.warning("Redis get error: %s", e)
+
+        self._count(False)
+        return None
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache with optional TTL"""
         ttl = ttl or settings.REDIS_TTL
-        value_str = json.dumps(value, ensure_ascii=False)
         
         if self.redis_client:
             try:
-                self.redis_client.setex(key, ttl, value_str)
+                data, size = self.codec.encode_sized(value)
+                self.redis_client.setex(key, ttl, data)
+                self.memory_cache.set(key, value, size, self._l1_ttl(ttl))
                 return True
             except Exception as e:
-                print(f"⚠️ Redis set error: {e}")
+                logger.warning("Redis set error: %s", e)
         
-        # Fallback to memory cache (limit size to prevent memory issues)
-        if len(self.memory_cache) < 100:  # Limit to 100 entries
-            self.memory_cache[key] = value
-            return True
-        return False
+        # Fallback to memory cache (bounded in bytes, LRU eviction)
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        return self.memory_cache.set(key, value, size, ttl)
     
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
+        deleted = self.memory_cache.delete(key)
         if self.redis_client:
             try:
                 self.redis_client.delete(key)
                 return True
             except Exception:
                 pass
-        
-        # Fallback to memory cache
-        if key in self.memory_cache:
-            del self.memory_cache[key]
-            return True
-        return False
+        return deleted
     
+    def namespace(self, name: str, ttl: int, max_bytes: int) -> "CacheNamespace":
+        """Get or create a dedicated cache area with its own TTL and memory budget"""
+        if name not in self.namespaces:
+            self.namespaces[name] = CacheNamespace(self, name, ttl, max_bytes)
+        return self.namespaces[name]
+
+    def stats(self) -> dict:
+        """Hit/miss counters of the main cache and of every namespace"""
+        with self.memory_cache.lock:
+            lookups = self.hits + self.misses
+            main = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+        main.update(self.memory_cache.stats())
+        stats = {"default": main}
+        stats.update({name: ns.stats() for name, ns in self.namespaces.items()})
+        if self.redis_client:
+            stats["codec"] = self.codec.stats()
+        return stats
+
     def clear(self):
         """Clear all cache"""
         if self.redis_client:
@@ -109,6 +261,98 @@ class Cache:
             except Exception:
                 pass
         self.memory_cache.clear()
+        for ns in self.namespaces.values():
+            ns.local.clear()
+
+class CacheNamespace:
+    """Cache area for one kind of data (e.g. OCR text per page).
+
+    Values are strings. Keys are prefixed with the namespace name in Redis and
+    expire after the namespace TTL; a local MemoryCache bounded by `max_bytes`
+    keeps hot entries in memory and serves as fallback when Redis is absent.
+    Keys are content hashes, so local copies never go stale.
+    """
+
+    def __init__(self, cache: Cache, name: str, ttl: int, max_bytes: int):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.local = MemoryCache(max_bytes, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is None and self.cache.redis_client:
+            try:
+                data = self.cache.redis_client.get(f"{self.name}:{key}")
+                if data is not None:
+                    # Entries written before the codec existed are plain UTF-8 text
+                    value = self.cache.codec.decode(data, legacy=lambda raw: raw.decode("utf-8"))
+                    self.local.set(key, value, len(value.encode("utf-8")))
+            except Exception as e:
+                logger.warning("Redis get error (%s): %s", self.name, e)
+
+        with self.lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self.local.set(key, value, len(value.encode("utf-8")))
+        if self.cache.redis_client:
+            try:
+                self.cache.redis_client.setex(f"{self.name}:{key}", self.ttl, self.cache.codec.encode(value))
+            except Exception as e:
+                logger.warning("Redis set error (%s): %s", self.name, e)
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Values of several keys (None when missing): local hits first, the rest in one MGET"""
+        values = [self.local.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.cache.redis_client:
+            try:
+                found = self.cache.redis_client.mget([f"{self.name}:{keys[i]}" for i in missing])
+                for i, data in zip(missing, found):
+                    if data is not None:
+                        value = self.cache.codec.decode(data, legacy=lambda raw: raw.decode("utf-8"))
+                        self.local.set(keys[i], value, len(value.encode("utf-8")))
+                        values[i] = value
+            except Exception as e:
+                logger.warning("Redis mget error (%s): %s", self.name, e)
+
+        hits = sum(1 for value in values if value is not None)
+        with self.lock:
+            self.hits += hits
+            self.misses += len(values) - hits
+        return values
+
+    def set_many(self, items: List[Tuple[str, str]]):
+        """Store several (key, value) pairs: one pipelined round-trip to Redis"""
+        for key, value in items:
+            self.local.set(key, value, len(value.encode("utf-8")))
+        if items and self.cache.redis_client:
+            try:
+                pipe = self.cache.redis_client.pipeline(transaction=False)
+                for key, value in items:
+                    pipe.setex(f"{self.name}:{key}", self.ttl, self.cache.codec.encode(value))
+                pipe.execute()
+            except Exception as e:
+                logger.warning("Redis set error (%s): %s", self.name, e)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+        stats.update(self.local.stats())
+        return stats
 
 # Global cache instance
 cache = Cache()
@@ -0,0 +1,133 @@
+# app/core/codec.py
+import json
+import threading
+import time
+import zlib
+from typing import Any, Callable
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Optional faster/denser formats, used only when installed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Every encoded value starts with this marker followed by one byte for the
+# serializer and one for the compressor. Legacy entries (plain JSON or text
+# written before the codec existed) never start with a NUL byte.
+MAGIC = b"\x00SC"
+
+SERIALIZERS = {"json": b"j", "msgpack": b"m"}
+COMPRESSORS = {"none": b"n", "zlib": b"z", "zstd": b"s"}
+
+
+class Codec:
+    """Binary encoding of cache values: compact JSON or msgpack, optionally compressed.
+
+    Unavailable formats fall back to json/zlib. Values smaller than `min_size`
+    bytes are stored uncompressed. Decoding reads the format marker, so entries
+    written with other settings (or before the codec existed) stay readable.
+    """
+
+    def __init__(self, serializer: str = "json", compression: str = "zlib", level: int = 6, min_size: int = 512):
+        if serializer == "msgpack" and not MSGPACK_AVAILABLE:
+            logger.warning("msgpack not installed, cache values serialized as JSON")
+            serializer = "json"
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            logger.warning("zstandard not installed, cache values compressed with zlib")
+            compression = "zlib"
+        if serializer not in SERIALIZERS or compression not in COMPRESSORS:
+            raise ValueError(f"Unknown cache codec: {serializer}/{compression}")
+        self.serializer = serializer
+        self.compression = compression
+        self.level = level
+        self.min_size = min_size
+        # ZstdCompressor objects are not thread-safe (Cache.set runs in worker threads): one per thread
+        self._local = threading.local()
+        self.lock = threading.Lock()
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.encode_count = 0
+        self.encode_seconds = 0.0
+        self.decode_count = 0
+        self.decode_seconds = 0.0
+
+    def _serialize(self, value: Any) -> bytes:
+        if self.serializer == "msgpack":
+            return msgpack.packb(value, use_bin_type=True)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _compress(self, data: bytes):
+        if len(data) < self.min_size or self.compression == "none":
+            return COMPRESSORS["none"], data
+        if self.compression == "zstd":
+            compressor = getattr(self._local, "zstd_compressor", None)
+            if compressor is None:
+                compressor = self._local.zstd_compressor = zstandard.ZstdCompressor(level=self.level)
+            return COMPRESSORS["zstd"], compressor.compress(data)
+        return COMPRESSORS["zlib"], zlib.compress(data, self.level)
+
+    def encode(self, value: Any) -> bytes:
+        return self.encode_sized(value)[0]
+
+    def encode_sized(self, value: Any):
+        """Encode a value; also returns its uncompressed serialized size"""
+        start = time.perf_counter()
+        raw = self._serialize(value)
+        compressor, payload = self._compress(raw)
+        encoded = MAGIC + SERIALIZERS[self.serializer] + compressor + payload
+        with self.lock:
+            self.encode_count += 1
+            self.encode_seconds += time.perf_counter() - start
+            self.raw_bytes += len(raw)
+            self.stored_bytes += len(encoded)
+        return encoded, len(raw)
+
+    def decode(self, data: bytes, legacy: Callable[[bytes], Any] = json.loads) -> Any:
+        """Decode a stored value; entries without the marker are parsed with `legacy`"""
+        return self.decode_sized(data, legacy)[0]
+
+    def decode_sized(self, data: bytes, legacy: Callable[[bytes], Any] = json.loads):
+        """Decode a stored value; also returns its uncompressed serialized size (as encode_sized)"""
+        start = time.perf_counter()
+        if not data.startswith(MAGIC):
+            value = legacy(data)
+            size = len(data)
+        else:
+            serializer, compressor, payload = data[3:4], data[4:5], data[5:]
+            if compressor == COMPRESSORS["zlib"]:
+                payload = zlib.decompress(payload)
+            elif compressor == COMPRESSORS["zstd"]:
+                # ZstdDecompressor objects are not thread-safe: one per call
+                payload = zstandard.ZstdDecompressor().decompress(payload)
+            size = len(payload)
+            if serializer == SERIALIZERS["msgpack"]:
+                value = msgpack.unpackb(payload, raw=False)
+            else:
+                value = json.loads(payload)
+        with self.lock:
+            self.decode_count += 1
+            self.decode_seconds += time.perf_counter() - start
+        return value, size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "format": f"{self.serializer}+{self.compression}",
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "compression_ratio": round(self.raw_bytes / self.stored_bytes, 3) if self.stored_bytes else 0.0,
+                "encode_count": self.encode_count,
+                "encode_ms_avg": round(1000 * self.encode_seconds / self.encode_count, 3) if self.encode_count else 0.0,
+                "decode_count": self.decode_count,
+                "decode_ms_avg": round(1000 * self.decode_seconds / self.decode_count, 3) if self.decode_count else 0.0,
+            }
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -5,6 +6,7 @@ load_dotenv()
 
 class Settings:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # e.g. a local OpenAI-compatible server for tests
     CHROMA_PATH = os.getenv("CHROMA_PATH", "app/data/chroma_db")
     MODEL_NAME = "gpt-4o-mini"  # ou GPT-4-turbo
     EMBEDDING_MODEL = "text-embedding-3-large"
@@ -16,7 +18,107 @@ class Settings:
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
     REDIS_TTL = int(os.getenv("REDIS_TTL", "3600"))  # 1 hour default
+    # In-memory cache tier: whole cache without Redis, L1 in front of Redis otherwise
+    CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 MB
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "60"))  # seconds an L1 copy of a Redis entry is trusted
+    # Encoding of values stored in Redis (older plain JSON entries stay readable)
+    CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "json")  # json (compact) or msgpack
+    CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")  # zlib, zstd or none
+    CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", "6"))
+    CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "512"))  # smaller values stored as-is
+    # LLM gateway: per-process limits on OpenAI calls (0 = unlimited for RPM/TPM)
+    LLM_RPM = int(os.getenv("LLM_RPM", "500"))  # requests per minute
+    LLM_TPM = int(os.getenv("LLM_TPM", "200000"))  # tokens per minute (prompt + completion)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # in-flight requests
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))  # deadline per call, retries included (seconds)
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))  # seconds, doubled at each retry
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+    # USD per million tokens, [prompt, completion] per model (JSON), for the cost metric
+    LLM_PRICES = json.loads(os.getenv("LLM_PRICES", json.dumps({
+        "gpt-4o-mini": [0.15, 0.60],
+        "gpt-4o": [2.50, 10.00],
+        "gpt-4-turbo": [10.00, 30.00],
+        "text-embedding-3-large": [0.13, 0.0],
+        "text-embedding-3-small": [0.02, 0.0],
+    })))
+    LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "1000"))  # reserved before usage is known
+    # Logging (records written by a background thread; "json" = one object per line)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json
+    # Debug artifacts (OCR text, raw extraction): share of requests saved, directory, files kept
+    DEBUG_ARTIFACTS_SAMPLE_RATE = float(os.getenv("DEBUG_ARTIFACTS_SAMPLE_RATE", "0"))  # 0 = off, 1 = every request
+    DEBUG_ARTIFACTS_DIR = os.getenv("DEBUG_ARTIFACTS_DIR", "app/data/debug")
+    DEBUG_ARTIFACTS_MAX_FILES = int(os.getenv("DEBUG_ARTIFACTS_MAX_FILES", "200"))
     # Uvicorn workers (0 = auto-detect based on CPU)
     UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", "2"))
+    # Rule-based parameter extraction before the LLM (the LLM is only called below these thresholds)
+    RULE_EXTRACTION = os.getenv("RULE_EXTRACTION", "true").lower() == "true"
+    RULE_EXTRACTION_MIN_CONFIDENCE = float(os.getenv("RULE_EXTRACTION_MIN_CONFIDENCE", "0.6"))
+    RULE_EXTRACTION_MIN_PARAMS = int(os.getenv("RULE_EXTRACTION_MIN_PARAMS", "4"))
+    # Extractor prompt: keep only lines likely to hold parameters, within a token budget
+    EXTRACTION_FILTER = os.getenv("EXTRACTION_FILTER", "true").lower() == "true"
+    EXTRACTION_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", "3000"))
+    # Value/unit lines kept around a relevant line when filtering (tables with one cell per line)
+    EXTRACTION_CONTEXT_LINES = int(os.getenv("EXTRACTION_CONTEXT_LINES", "2"))
+    # Long reports: relevant text over the budget is split by page into chunks extracted concurrently
+    EXTRACTION_CHUNKING = os.getenv("EXTRACTION_CHUNKING", "true").lower() == "true"
+    EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))  # chunks in flight per document
+    # OCR of scanned pages
+    OCR_MODE = os.getenv("OCR_MODE", "process")  # process (page-parallel pool) or serial
+    OCR_DPI = int(os.getenv("OCR_DPI", "200"))  # rendering resolution (PyMuPDF default is 72)
+    OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+    OCR_BINARIZE = os.getenv("OCR_BINARIZE", "false").lower() == "true"
+    OCR_BINARIZE_THRESHOLD = int(os.getenv("OCR_BINARIZE_THRESHOLD", "160"))  # 0-255
+    # OCR processes per API process (default: share the CPUs between Uvicorn workers)
+    OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // max(1, UVICORN_WORKERS))
+    # Per-page OCR text cache (repeated pages such as letterheads or annexes are free)
+    OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", "604800"))  # 7 days
+    OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # local memory budget
+    # LLM stage memoization (analysis, recommendations, summaries keyed on their inputs)
+    STAGE_CACHE_TTL = int(os.getenv("STAGE_CACHE_TTL", "86400"))  # 1 day
+    STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))  # per stage
+    # Embeddings: "openai" (EMBEDDING_MODEL) or "local" (sentence-transformers on CPU, no network round-trip).
+    # Each backend has its own Chroma collection: vectors of different models are not comparable.
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+    LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"  # keyed on backend, model and normalized text
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 86400)))  # 30 days
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # local memory budget
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))  # texts per embeddings request
+    # Knowledge-base ingestion (POST /docs/upload, python -m app.ingest)
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1500"))  # characters per chunk
+    INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "200"))  # characters shared by consecutive chunks
+    INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "256"))  # chunks per Chroma upsert
+    INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))  # documents processed at once
+    # Recommendation context: facet filters + vector/BM25 fusion
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))  # chunks in the prompt
+    RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))  # per ranking, before fusion
+    RETRIEVAL_CONTEXT_TOKENS = int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "1200"))  # cap on the context in the prompt
+    RETRIEVAL_INDEX_TTL = int(os.getenv("RETRIEVAL_INDEX_TTL", "300"))  # BM25 index background rebuild interval (seconds)
+    RETRIEVAL_INDEX_PAGE = int(os.getenv("RETRIEVAL_INDEX_PAGE", "1000"))  # chunks read per page when rebuilding
+    # Single-flight: identical concurrent uploads share one pipeline run (across workers via Redis)
+    SINGLEFLIGHT_LOCK_TTL = int(os.getenv("SINGLEFLIGHT_LOCK_TTL", "600"))  # max duration of a leader run
+    SINGLEFLIGHT_WAIT_TIMEOUT = int(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", "600"))  # follower wait before computing itself
+    # Background report jobs (POST /jobs)
+    # JOB_BACKEND: "memory" (single process) or "redis" (shared queue, separate workers)
+    JOB_BACKEND = os.getenv("JOB_BACKEND", "auto")  # auto = redis if available, else memory
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # concurrent jobs per process
+    JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))  # pending jobs before rejecting (503)
+    JOB_TTL = int(os.getenv("JOB_TTL", "86400"))  # job status retention (seconds)
+    # Run job workers inside the web process; set to "false" when using `python -m app.worker`
+    JOB_EMBEDDED_WORKERS = os.getenv("JOB_EMBEDDED_WORKERS", "true").lower() == "true"
+    # POST /analyze/stream: comment line sent when no event was sent for this long (seconds)
+    SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    # Uploads: read in chunks, rejected with 413 above the limit (see app/core/uploads.py)
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))  # one report
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    # POST /analyze/batch
+    BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))  # whole request
+    BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))  # documents per batch (zip members included)
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # reports of a batch analyzed at once
+    # Startup warm-up of the orchestrator, Chroma, OCR pool... (see app/core/startup.py):
+    # blocking (serve once warm), background (serve at once, GET /ready reports progress) or off
+    WARMUP_MODE = os.getenv("WARMUP_MODE", "blocking")
 
 settings = Settings()
@@ -0,0 +1,146 @@
+# app/core/embeddings.py
+"""Text embeddings for the knowledge base, with a shared cache.
+
+Backends (settings.EMBEDDING_BACKEND):
+- "openai": EMBEDDING_MODEL through the LLM gateway,
+- "local": a sentence-transformers model on CPU (optional dependency),
+  which removes the network round-trip from retrieval.
+Vectors are cached in the `embedding` namespace of the shared Cache, keyed on
+backend, model and the whitespace-normalized text, so repeated queries and
+re-ingested chunks are not embedded again.
+"""
+import asyncio
+import base64
+import re
+import threading
+from array import array
+from typing import List
+
+from app.core.cache import cache, canonical_hash
+from app.core.config import settings
+from app.core.llm_gateway import get_llm_gateway
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace differences do not change the cache key"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _pack(vector: List[float]) -> str:
+    """float32 + base64: about 4x smaller than JSON numbers in the cache"""
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> List[float]:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(data))
+    return vector.tolist()
+
+
+class OpenAIEmbedder:
+    backend = "openai"
+
+    def __init__(self, model: str):
+        self.model = model
+        self.llm = get_llm_gateway()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(await self.llm.embed(self.model, texts[start:start + batch_size]))
+        return vectors
+
+
+class LocalEmbedder:
+    """sentence-transformers model loaded on first use (pip install sentence-transformers)"""
+    backend = "local"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def _get_encoder(self):
+        with self._lock:
+            if self._encoder is None:
+                from sentence_transformers import SentenceTransformer
+                logger.info("Loading local embedding model %s", self.model)
+                self._encoder = SentenceTransformer(self.model, device="cpu")
+            return self._encoder
+
+    def load(self):
+        """Load the model now instead of on the first query (startup warm-up)"""
+        self._get_encoder()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self._get_encoder().encode(
+            texts, batch_size=settings.EMBEDDING_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True
+        ).tolist()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        # CPU-bound: keep it off the event loop
+        return await asyncio.to_thread(self._encode, texts)
+
+
+class CachedEmbedder:
+    """Embeds only the texts missing from the shared cache, in a single backend call"""
+
+    def __init__(self, embedder, use_cache: bool = True):
+        self.embedder = embedder
+        self.backend = embedder.backend
+        self.model = embedder.model
+        self.cache = cache.namespace("embedding", settings.EMBEDDING_CACHE_TTL, settings.EMBEDDING_CACHE_MAX_BYTES) if use_cache else None
+
+    @property
+    def collection_name(self) -> str:
+        """Chroma collection for this backend ("agro_docs" for OpenAI, as before)"""
+        if self.backend == "openai":
+            return "agro_docs"
+        return "agro_docs_" + re.sub(r"[^a-zA-Z0-9]+", "_", self.model.split("/")[-1]).strip("_").lower()
+
+    def _key(self, text: str) -> str:
+        return canonical_hash(self.backend, self.model, normalize_text(text))
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return await self.embedder.embed(texts)
+
+        keys = [self._key(text) for text in texts]
+        # Redis I/O is blocking: run it in a worker thread (one MGET for the whole batch)
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+        vectors = [_unpack(data) if data is not None else None for data in cached]
+
+        missing = {}  # key -> first index (duplicate texts are embedded once)
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, i)
+        if missing:
+            computed = await self.embedder.embed([texts[i] for i in missing.values()])
+            fresh = dict(zip(missing, computed))
+            vectors = [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+            await asyncio.to_thread(self.cache.set_many, [(key, _pack(vector)) for key, vector in fresh.items()])
+        return vectors
+
+    async def embed_one(self, text: str) -> List[float]:
+        return (await self.embed([text]))[0]
+
+
+# Embedder shared by the vector stores of this process
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> CachedEmbedder:
+    """Get or create the configured embedder (singleton; the startup warm-up calls it from several threads)"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if settings.EMBEDDING_BACKEND == "local":
+                backend = LocalEmbedder(settings.LOCAL_EMBEDDING_MODEL)
+            else:
+                backend = OpenAIEmbedder(settings.EMBEDDING_MODEL)
+            _embedder = CachedEmbedder(backend, use_cache=settings.EMBEDDING_CACHE)
+        return _embedder
@@ -0,0 +1,147 @@
+# app/core/ingestion.py
+"""Knowledge-base ingestion: parse, chunk, embed and upsert agronomy documents.
+
+- PDFs go through the report OCR stack (text layer, OCR for scanned pages);
+  .txt/.md files are read as UTF-8.
+- Text is split into overlapping chunks on paragraph/sentence boundaries.
+- Chunks are embedded and upserted in batches (see VectorStore.upsert_chunks)
+  with deterministic IDs (source + chunk number), so re-ingesting replaces
+  instead of duplicating.
+- Each chunk is tagged with the retrieval facets it mentions (`tag_<name>`
+  metadata, see app/core/retrieval.py).
+- A document whose content hash is unchanged since its last ingestion is skipped.
+"""
+import asyncio
+import hashlib
+import os
+import re
+from typing import List
+
+from app.agents.ocr_agent import OcrAgent
+from app.core.cache import content_hash
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.retrieval import text_tags
+from app.core.utils import PAGE_SEPARATOR
+
+logger = get_logger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+# Bumped when chunking or chunk metadata change: older documents are re-ingested
+INGEST_VERSION = 2
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def _split_long(piece: str, size: int) -> List[str]:
+    """A paragraph longer than a chunk: split on sentence ends, then on words"""
+    parts, current = [], ""
+    for sentence in SENTENCE_END.split(piece):
+        while len(sentence) > size:
+            cut = sentence.rfind(" ", 0, size)
+            cut = cut if cut > 0 else size
+            parts.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > size:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def chunk_text(text: str, size: int, overlap: int) -> List[str]:
+    """Chunks of about `size` characters; each one starts with the last `overlap`
+    characters of the previous one (cut at a word boundary) to keep context"""
+    paragraphs = []
+    for block in re.split(r"\n\s*\n|" + PAGE_SEPARATOR, text):
+        block = re.sub(r"\s+", " ", block).strip()
+        if block:
+            paragraphs.extend(_split_long(block, size) if len(block) > size else [block])
+
+    chunks, current = [], ""
+    for paragraph in paragraphs:
+        if current and len(current) + 1 + len(paragraph) > size:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap > 0 else ""
+            if " " in tail:
+                tail = tail[tail.index(" ") + 1:]
+            current = f"{tail} {paragraph}" if tail else paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_document(filename: str, content: bytes) -> str:
+    """Text of a PDF (through the OCR stack) or of a UTF-8 text file. Blocking."""
+    if filename.lower().endswith(".pdf") or content.startswith(b"%PDF"):
+        return OcrAgent().extract_text(content)
+    return content.decode("utf-8", errors="replace")
+
+
+def _source_id(source: str) -> str:
+    return hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
+
+async def ingest_document(vstore, source: str, content: bytes, metadata: dict = None) -> dict:
+    """Index one document under `source` (its file name or path).
+    Returns {"source", "status": "indexed" | "unchanged" | "empty", "chunks"}.
+    """
+    doc_hash = content_hash(content)
+    previous = await vstore.source_metadata(source)
+    if previous and previous.get("doc_hash") == doc_hash and previous.get("ingest_version") == INGEST_VERSION:
+        return {"source": source, "status": "unchanged", "chunks": 0}
+
+    text = await asyncio.to_thread(parse_document, source, content)
+    chunks = chunk_text(text, settings.INGEST_CHUNK_SIZE, settings.INGEST_CHUNK_OVERLAP)
+    if previous is not None:
+        # Changed document: drop its old chunks (the new version may have fewer)
+        await vstore.delete_source(source)
+    if not chunks:
+        return {"source": source, "status": "empty", "chunks": 0}
+
+    source_id = _source_id(source)
+    ids = [f"{source_id}:{i:05d}" for i in range(len(chunks))]
+    metadatas = [
+        {**(metadata or {}), "source": source, "doc_hash": doc_hash, "ingest_version": INGEST_VERSION, "chunk": i,
+         **{f"tag_{tag}": True for tag in text_tags(chunk)}}
+        for i, chunk in enumerate(chunks)
+    ]
+    await vstore.upsert_chunks(ids, chunks, metadatas)
+    logger.info("Ingested %s: %d chunks", source, len(chunks))
+    return {"source": source, "status": "indexed", "chunks": len(chunks)}
+
+
+async def ingest_paths(vstore, paths: List[str]) -> List[dict]:
+    """Ingest files and directories (recursively), INGEST_CONCURRENCY documents at a time"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        else:
+            files.append(path)
+
+    semaphore = asyncio.Semaphore(max(1, settings.INGEST_CONCURRENCY))
+
+    async def ingest(path):
+        async with semaphore:
+            try:
+                content = await asyncio.to_thread(_read_file, path)
+                return await ingest_document(vstore, path, content, {"filename": os.path.basename(path)})
+            except Exception as e:
+                logger.exception("Ingestion failed for %s: %s", path, e)
+                return {"source": path, "status": "error", "chunks": 0, "error": str(e)}
+
+    return await asyncio.gather(*(ingest(path) for path in files))
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,249 @@
+# app/core/jobs.py
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.agents.orchestrator_agent import PIPELINE_STAGES, get_orchestrator
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.log import get_logger, request_id_var
+from app.core.singleflight import single_flight
+
+logger = get_logger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds JOB_QUEUE_MAX pending jobs"""
+
+
+def new_job(filename: str, cache_key: str) -> dict:
+    """Build the initial status document of a job"""
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "status": "queued",  # queued -> running -> done | error
+        "filename": filename,
+        "cache_key": cache_key,
+        "stages": {stage: "pending" for stage in PIPELINE_STAGES},
+        "error": None,
+        "request_id": request_id_var.get(),  # request that submitted the job, for log correlation
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class InMemoryJobBackend:
+    """Job states and queue kept in the current process (single worker setups)"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.jobs = {}
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._queue = None  # created lazily inside the running event loop
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def save(self, job: dict):
+        with self.lock:
+            self.jobs[job["id"]] = dict(job)
+            # Drop finished jobs older than the retention period
+            expired = [jid for jid, j in self.jobs.items()
+                       if j["status"] in ("done", "error") and time.time() - j["updated_at"] > self.ttl]
+            for jid in expired:
+                del self.jobs[jid]
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    async def push(self, job_id: str, content: bytes):
+        try:
+            self.queue.put_nowait((job_id, content))
+        except asyncio.QueueFull:
+            raise QueueFullError()
+
+    async def pop(self):
+        return await self.queue.get()
+
+
+class RedisJobBackend:
+    """Job states and queue stored in Redis, so any process can run the jobs"""
+
+    QUEUE_KEY = "jobs:queue"
+
+    def __init__(self, client, maxsize: int, ttl: int):
+        self.client = client
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def save(self, job: dict):
+        self.client.setex(f"job:{job['id']}", self.ttl, json.dumps(job, ensure_ascii=False))
+
+    def load(self, job_id: str) -> Optional[dict]:
+        value = self.client.get(f"job:{job_id}")
+        return json.loads(value) if value else None
+
+    async def push(self, job_id: str, content: bytes):
+        payload_key = f"job_payload:{job_id}"
+        await asyncio.to_thread(self.client.setex, payload_key, self.ttl, content)
+        # RPUSH returns the new length atomically: workers pushing concurrently cannot
+        # both pass a separate LLEN check and overfill the queue
+        length = await asyncio.to_thread(self.client.rpush, self.QUEUE_KEY, job_id)
+        if length > self.maxsize:
+            # Taken back unless a consumer already popped it, in which case it runs
+            if await asyncio.to_thread(self.client.lrem, self.QUEUE_KEY, -1, job_id):
+                await asyncio.to_thread(self.client.delete, payload_key)
+                raise QueueFullError()
+
+    async def pop(self):
+        while True:
+            # Short BLPOP timeout: the shared client has a 2s socket timeout
+            item = await asyncio.to_thread(self.client.blpop, self.QUEUE_KEY, 1)
+            if not item:
+                continue
+            job_id = item[1].decode()
+            payload_key = f"job_payload:{job_id}"
+            payload = await asyncio.to_thread(self.client.get, payload_key)
+            await asyncio.to_thread(self.client.delete, payload_key)
+            if payload is None:
+                logger.warning("Job %s payload expired, skipping", job_id)
+                continue
+            return job_id, payload
+
+
+async def run_report(content: bytes, cache_key: str, progress=None, on_event=None) -> dict:
+    """Run the full pipeline on a PDF and store the report in the cache.
+    Identical concurrent uploads are coalesced: only one run per cache key at a time.
+    `progress` and `on_event` only fire for the caller that actually runs the pipeline.
+    """
+    async def compute():
+        # Already built by the startup warm-up, unless WARMUP_MODE=off or it is still running
+        orchestrator = await asyncio.to_thread(get_orchestrator)
+        report = await orchestrator.run(content, language="fr", progress=progress, on_event=on_event)
+        # Failed extractions (API or schema errors) are retried on the next upload
+        if not report.get("error"):
+            await asyncio.to_thread(cache.set, cache_key, report)
+        return report
+
+    return await single_flight.do(cache_key, compute)
+
+
+class JobManager:
+    """Bounded pool of workers running report jobs from a backend queue"""
+
+    def __init__(self, backend, workers: int):
+        self.backend = backend
+        self.workers = workers
+        self._tasks = []
+
+    async def submit(self, filename: str, content: bytes, cache_key: str) -> dict:
+        """Create a job; served from the cache immediately when the report already exists"""
+        job = new_job(filename, cache_key)
+        if await asyncio.to_thread(cache.get, cache_key) is not None:
+            job["status"] = "done"
+            job["stages"] = {stage: "done" for stage in PIPELINE_STAGES}
+            await asyncio.to_thread(self.backend.save, job)
+            return job
+        await asyncio.to_thread(self.backend.save, job)
+        await self.backend.push(job["id"], content)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Blocking (Redis backend): call through asyncio.to_thread"""
+        return self.backend.load(job_id)
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info("%d job worker(s) started (%s)", self.workers, type(self.backend).__name__)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _update(self, job: dict, lock: asyncio.Lock, **fields):
+        """Save the job state in a worker thread (Redis I/O). Saves of one job are
+        serialized by `lock` and snapshot the state when they run, so a later
+        state is never overwritten by an earlier one."""
+        async with lock:
+            job.update(fields)
+            job["updated_at"] = time.time()
+            await asyncio.to_thread(self.backend.save, {**job, "stages": dict(job["stages"])})
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job_id, content = await self.backend.pop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Job worker %d queue error: %s", index, e)
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                job = await asyncio.to_thread(self.backend.load, job_id)
+            except Exception as e:
+                logger.warning("Job worker %d could not load job %s: %s", index, job_id, e)
+                continue
+            if job is None:
+                continue
+            # Worker tasks are long-lived: log this job under the ID of the request that submitted it
+            request_id_var.set(job.get("request_id") or job_id)
+            lock = asyncio.Lock()
+            saves = set()  # progress saves in flight (strong references until done)
+
+            async def save_progress():
+                try:
+                    await self._update(job, lock)
+                except Exception as e:
+                    logger.warning("Job %s progress save failed: %s", job["id"], e)
+
+            def progress(stage, status):
+                # Called synchronously by the orchestrator: the save runs in the background
+                job["stages"][stage] = status
+                task = asyncio.create_task(save_progress())
+                saves.add(task)
+                task.add_done_callback(saves.discard)
+
+            try:
+                await self._update(job, lock, status="running")
+                report = await run_report(content, job["cache_key"], progress=progress)
+                if report.get("error"):
+                    # Not cached, so there is no result to serve: report the extraction failure
+                    await self._update(job, lock, status="error", error=report["error"])
+                else:
+                    await self._update(job, lock, status="done")
+            except asyncio.CancelledError:
+                await self._update(job, lock, status="error", error="Job annulé (arrêt du worker)")
+                raise
+            except Exception as e:
+                logger.exception("Job %s failed: %s", job_id, e)
+                try:
+                    await self._update(job, lock, status="error", error=str(e))
+                except Exception as save_error:
+                    logger.warning("Job %s status save failed: %s", job_id, save_error)
+
+
+def _create_backend():
+    use_redis = settings.JOB_BACKEND == "redis" or (settings.JOB_BACKEND == "auto" and cache.redis_client)
+    if use_redis and cache.redis_client:
+        return RedisJobBackend(cache.redis_client, settings.JOB_QUEUE_MAX, settings.JOB_TTL)
+    if use_redis:
+        logger.warning("JOB_BACKEND=redis but Redis is not available, using in-memory job queue")
+    return InMemoryJobBackend(settings.JOB_QUEUE_MAX, settings.JOB_TTL)
+
+
+# Global job manager instance
+job_manager = JobManager(_create_backend(), settings.JOB_WORKERS)
@@ -0,0 +1,274 @@
+# app/core/llm_gateway.py
+"""Single entry point for OpenAI calls (chat completions and embeddings).
+
+Every call goes through the same per-process limits:
+- a concurrency cap (semaphore) on in-flight requests,
+- token buckets for requests per minute and tokens per minute,
+- a deadline covering queueing, retries and the request itself,
+- retries with jittered exponential backoff on 429, 5xx, timeouts and
+  connection errors (honouring Retry-After when the API sends it).
+The limits are per process: with several uvicorn workers, set LLM_RPM and
+LLM_TPM to the account limits divided by the number of workers.
+The openai package (about 0.7 s to import) is loaded when the gateway is created.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import LLM_COST, LLM_IN_FLIGHT, LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_TOKENS
+from app.core.utils import count_tokens
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = get_logger(__name__)
+
+
+class LLMTimeoutError(TimeoutError):
+    """The call could not complete before its deadline"""
+
+
+class TokenBucket:
+    """Continuously refilled budget of `per_minute` units (0 = unlimited)"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    async def acquire(self, amount: float, deadline: float):
+        if not self.per_minute:
+            return
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            wait = (amount - self.tokens) * 60 / self.per_minute
+            if time.monotonic() + wait > deadline:
+                raise LLMTimeoutError("Rate limit budget not available before the deadline")
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount: float):
+        """Correct a reservation once the real usage is known (negative = refund)"""
+        if self.per_minute:
+            self._refill()
+            self.tokens = max(-self.capacity, min(self.capacity, self.tokens - amount))
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                          openai.InternalServerError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """USD cost of one call from LLM_PRICES (dated snapshots such as "gpt-4o-mini-2024-07-18"
+    use the price of their base model); None for a model without a price"""
+    prices = settings.LLM_PRICES.get(model)
+    if prices is None:
+        base = max((name for name in settings.LLM_PRICES if model.startswith(name + "-")), key=len, default=None)
+        prices = settings.LLM_PRICES.get(base)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class LLMGateway:
+    def __init__(self, client: "AsyncOpenAI", rpm: int, tpm: int, max_concurrency: int,
+                 timeout: float, max_retries: int, backoff_base: float, backoff_max: float):
+        self.client = client
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = None
+        self._loop = None
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0, "in_flight": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one event loop (tests and scripts may run several)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        return self._semaphore
+
+    async def chat(self, on_token=None, timeout: Optional[float] = None, **kwargs) -> str:
+        """Run a chat completion and return its text.
+        When `on_token` is given the response is streamed and each text delta is passed to it;
+        a stream is only retried if it failed before its first delta.
+        """
+        estimate = sum(count_tokens(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+        estimate += kwargs.get("max_tokens") or settings.LLM_COMPLETION_TOKENS_ESTIMATE
+
+        streamed = False
+        if on_token is None:
+            async def request():
+                response = await self.client.chat.completions.create(**kwargs)
+                return response.choices[0].message.content.strip(), response.usage
+        else:
+            async def request():
+                nonlocal streamed
+                parts, usage = [], None
+                stream = await self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **kwargs
+                )
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        delta = chunk.choices[0].delta.content
+                        parts.append(delta)
+                        streamed = True
+                        on_token(delta)
+                return "".join(parts).strip(), usage
+
+        # Tokens already forwarded to the client cannot be taken back
+        return await self._call(request, "chat", kwargs.get("model", ""), estimate, timeout,
+                                retryable=lambda: not streamed)
+
+    async def embed(self, model: str, input, timeout: Optional[float] = None) -> list:
+        """Embeddings for a string or a list of strings (one vector per input)"""
+        texts = [input] if isinstance(input, str) else list(input)
+        estimate = sum(count_tokens(text) for text in texts)
+
+        async def request():
+            response = await self.client.embeddings.create(model=model, input=input)
+            return [item.embedding for item in response.data], response.usage
+
+        return await self._call(request, "embedding", model, estimate, timeout)
+
+    async def _call(self, request, kind: str, model: str, estimate: int, timeout: Optional[float], retryable=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._stats["calls"] += 1
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise LLMTimeoutError("LLM call deadline exceeded")
+                # Rate limits first: a caller waiting for budget does not hold a concurrency slot
+                await self.requests.acquire(1, deadline)
+                await self.tokens.acquire(estimate, deadline)
+                semaphore = self._get_semaphore()
+                try:
+                    await asyncio.wait_for(semaphore.acquire(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError("LLM call deadline exceeded waiting for a concurrency slot") from None
+                self._stats["in_flight"] += 1
+                try:
+                    with LLM_IN_FLIGHT.track_inprogress(), LLM_REQUEST_DURATION.time(kind=kind):
+                        result, usage = await asyncio.wait_for(request(), deadline - time.monotonic())
+                finally:
+                    self._stats["in_flight"] -= 1
+                    semaphore.release()
+                LLM_REQUESTS.inc(kind=kind, outcome="success")
+                self._record_usage(usage, estimate, model)
+                return result
+            except LLMTimeoutError:
+                self._stats["timeouts"] += 1
+                LLM_REQUESTS.inc(kind=kind, outcome="timeout")
+                raise
+            except Exception as e:
+                # Full jitter: spreads retries of concurrent callers over the backoff window
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0)
+                can_retry = (
+                    _is_retryable(e) and attempt < self.max_retries
+                    and (retryable is None or retryable())
+                    and time.monotonic() + delay < deadline
+                )
+                if not can_retry:
+                    self._stats["failures"] += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._stats["timeouts"] += 1
+                        LLM_REQUESTS.inc(kind=kind, outcome="timeout")
+                        raise LLMTimeoutError("LLM call deadline exceeded") from e
+                    LLM_REQUESTS.inc(kind=kind, outcome="error")
+                    raise
+                attempt += 1
+                self._stats["retries"] += 1
+                LLM_REQUESTS.inc(kind=kind, outcome="retry")
+                logger.warning("LLM call failed (%s), retry %d/%d in %.1fs", type(e).__name__, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+    def _record_usage(self, usage, estimate: int, model: str):
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        self._stats["prompt_tokens"] += prompt
+        self._stats["completion_tokens"] += completion
+        LLM_TOKENS.inc(prompt, model=model, type="prompt")
+        if completion:
+            LLM_TOKENS.inc(completion, model=model, type="completion")
+        cost = llm_cost(model, prompt, completion)
+        if cost is not None:
+            self._stats["cost_usd"] += cost
+            LLM_COST.inc(cost, model=model)
+        self.tokens.adjust((prompt + completion) - estimate)
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+# Singleton gateway shared by all agents and the vector store
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Get or create the LLM gateway shared by all agents and the embedder.
+    One instance per process, so the rate limits, concurrency cap and usage counters
+    apply to all OpenAI traffic; locked because the startup warm-up builds agents in
+    several threads.
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                max_retries=0,  # retries are handled by the gateway
+                timeout=settings.LLM_TIMEOUT,
+            )
+            _gateway = LLMGateway(
+                client,
+                rpm=settings.LLM_RPM,
+                tpm=settings.LLM_TPM,
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES,
+                backoff_base=settings.LLM_BACKOFF_BASE,
+                backoff_max=settings.LLM_BACKOFF_MAX,
+            )
+        return _gateway
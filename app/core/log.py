@@ -0,0 +1,156 @@
+# app/core/log.py
+"""Application logging.
+
+- Records are put on an in-memory queue by a QueueHandler and written to
+  stdout by a QueueListener thread, so logging never blocks the event loop.
+- Every record carries the ID of the request (or job) it belongs to, taken
+  from a context variable set by the HTTP middleware and the job workers;
+  asyncio tasks and asyncio.to_thread calls inherit it.
+- Debug artifacts (OCR text, raw extraction) are only written for a sample
+  of requests, to content-addressed files with a retention cap.
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from typing import Optional
+
+from app.core.config import settings
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+ARTIFACT_NAME = re.compile(r"^[a-z_]+-[0-9a-f]{32}\.txt$")
+
+# Attributes present on every LogRecord; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request ID (runs in the caller's context, before queueing)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields given with `extra=` are included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+def setup_logging():
+    """Configure the "app" logger once: queue handler in front, stdout writer thread behind"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+
+    handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Module logger (`get_logger(__name__)`), with logging configured on first use"""
+    setup_logging()
+    return logging.getLogger(name)
+
+
+logger = get_logger(__name__)
+
+
+def save_debug_artifact(kind: str, content: str) -> Optional[str]:
+    """Write `content` for offline inspection, for DEBUG_ARTIFACTS_SAMPLE_RATE of the requests.
+
+    Files are named after their content hash ("ocr_text-<hash>.txt"): concurrent
+    requests never overwrite each other and identical documents are stored once.
+    Only the DEBUG_ARTIFACTS_MAX_FILES most recent artifacts are kept.
+    Blocking file I/O: call it through asyncio.to_thread from async code.
+    """
+    if not _sampled(settings.DEBUG_ARTIFACTS_SAMPLE_RATE):
+        return None
+
+    directory = settings.DEBUG_ARTIFACTS_DIR
+    data = content.encode("utf-8")
+    path = os.path.join(directory, f"{kind}-{hashlib.blake2b(data, digest_size=16).hexdigest()}.txt")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            os.utime(path)  # most recently used: kept by the retention below
+        else:
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        _prune_artifacts(directory, settings.DEBUG_ARTIFACTS_MAX_FILES)
+    except OSError as e:
+        logger.warning("Debug artifact not saved: %s", e)
+        return None
+
+    logger.info("Debug artifact saved: %s", path)
+    return path
+
+
+def _sampled(rate: float) -> bool:
+    """Sampling decided per request (hash of its ID): all artifacts of a sampled request are kept"""
+    if rate <= 0:
+        return False
+    request_id = request_id_var.get()
+    if request_id == "-":
+        return random.random() < rate
+    bucket = int.from_bytes(hashlib.blake2b(request_id.encode(), digest_size=8).digest(), "big")
+    return bucket / 2 ** 64 < rate
+
+
+def _prune_artifacts(directory: str, max_files: int):
+    entries = []
+    for entry in os.scandir(directory):
+        if ARTIFACT_NAME.match(entry.name):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue  # removed by a concurrent prune
+    entries.sort(reverse=True)
+    for _, path in entries[max_files:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,227 @@
+# app/core/metrics.py
+"""Minimal Prometheus instrumentation (text exposition format 0.0.4).
+
+Counters, gauges and histograms are kept in memory per process and rendered
+by `registry.render()` for the /metrics endpoint. With several uvicorn
+workers each process exposes its own values (the scraper sees the worker
+that answered). Collectors add values computed at scrape time, e.g. cache
+hit ratios from `Cache.stats()`.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Tuple
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Latency buckets in seconds: from cache hits to long OCR/LLM stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()  # also updated from worker threads (asyncio.to_thread)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self.lock:
+            items = sorted(self.values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]  # unlabelled metrics are exported from the start
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[tuple, list] = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        with self.lock:
+            items = sorted((key, list(entry)) for key, entry in self.values.items())
+        lines = []
+        for key, entry in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {entry[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(entry[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Callables returning [(name, type, help, [(labels dict, value), ...]), ...] at scrape time
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.warning("Metrics collector error: %s", e)
+                continue
+            for name, type_, help_, samples in families:
+                lines.append(f"# HELP {name} {help_}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Report pipeline
+STAGE_DURATION = registry.register(Histogram(
+    "soilsmart_stage_duration_seconds", "Duration of each report pipeline stage", ["stage"]))
+PIPELINE_DURATION = registry.register(Histogram(
+    "soilsmart_pipeline_duration_seconds", "Duration of a full report pipeline run", ["outcome"]))
+PIPELINES_IN_FLIGHT = registry.register(Gauge(
+    "soilsmart_pipelines_in_flight", "Report pipelines currently running"))
+
+# LLM gateway
+LLM_REQUEST_DURATION = registry.register(Histogram(
+    "soilsmart_llm_request_duration_seconds", "Duration of OpenAI requests (per attempt)", ["kind"]))
+LLM_REQUESTS = registry.register(Counter(
+    "soilsmart_llm_requests_total", "OpenAI request attempts by outcome", ["kind", "outcome"]))
+LLM_TOKENS = registry.register(Counter(
+    "soilsmart_llm_tokens_total", "Tokens reported by OpenAI usage", ["model", "type"]))
+LLM_COST = registry.register(Counter(
+    "soilsmart_llm_cost_usd_total", "Estimated OpenAI cost from usage and LLM_PRICES (USD)", ["model"]))
+LLM_IN_FLIGHT = registry.register(Gauge(
+    "soilsmart_llm_requests_in_flight", "OpenAI requests currently in flight"))
+
+# Startup
+STARTUP_DURATION = registry.register(Gauge(
+    "soilsmart_startup_duration_seconds", "Duration of startup phases (imports, warm-up of each component)", ["phase"]))
+
+# HTTP
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "soilsmart_http_request_duration_seconds", "Duration of HTTP requests", ["method", "route", "status"]))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "soilsmart_http_requests_in_flight", "HTTP requests currently being served"))
+
+
+def _cache_families() -> list:
+    """Cache counters and hit ratios (main cache and namespaces), read at scrape time"""
+    from app.core.cache import cache
+
+    stats = cache.stats()
+    stats.pop("codec", None)
+    families = {
+        "soilsmart_cache_hits_total": ("counter", "Cache lookups served", "hits"),
+        "soilsmart_cache_misses_total": ("counter", "Cache lookups not found", "misses"),
+        "soilsmart_cache_hit_ratio": ("gauge", "Share of cache lookups served since start", "hit_ratio"),
+        "soilsmart_cache_entries": ("gauge", "Entries in the in-memory cache tier", "entries"),
+        "soilsmart_cache_bytes": ("gauge", "Bytes held by the in-memory cache tier", "bytes"),
+        "soilsmart_cache_evictions_total": ("counter", "Entries evicted from the in-memory cache tier", "evictions"),
+    }
+    return [
+        (name, type_, help_, [({"cache": area}, values[field]) for area, values in stats.items() if field in values])
+        for name, (type_, help_, field) in families.items()
+    ]
+
+
+registry.add_collector(_cache_families)
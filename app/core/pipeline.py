@@ -0,0 +1,144 @@
+# app/core/pipeline.py
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable
+
+
+class PipelineHalt(Exception):
+    """Raised by a stage to stop the pipeline early (e.g. nothing to analyze).
+    Stages depending on it are not run; `run` returns the results obtained so far.
+    """
+
+    def __init__(self, reason: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        self.stage = None
+
+
+class Stage:
+    """One pipeline step: an async function called with the results of its declared inputs"""
+
+    def __init__(self, name: str, func: Callable[..., Awaitable], inputs: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+
+
+class Pipeline:
+    """Small DAG scheduler: each stage starts as soon as all of its inputs are available.
+
+    Inputs refer either to other stages or to initial values passed to `run`.
+    `run` returns the results of every stage plus a timing trace with the
+    critical path (the chain of stages that determined the total wall time).
+    If a stage raises PipelineHalt, only the completed stages have results and
+    the trace names the halting stage ("halted").
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        self._check()
+
+    def _check(self):
+        """Reject cycles so a misdeclared stage cannot deadlock a request"""
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done or name not in self.stages:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected in pipeline at stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].inputs:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, **initial):
+        origin = time.perf_counter()
+        futures = {}
+        timings = {}
+
+        for name, value in initial.items():
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            futures[name] = future
+
+        missing = {dep for s in self.stages.values() for dep in s.inputs} - set(self.stages) - set(initial)
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {', '.join(sorted(missing))}")
+
+        async def run_stage(stage: Stage):
+            args = await asyncio.gather(*(futures[dep] for dep in stage.inputs))
+            start = time.perf_counter()
+            try:
+                return await stage.func(**dict(zip(stage.inputs, args)))
+            except PipelineHalt as halt:
+                halt.stage = halt.stage or stage.name
+                raise
+            finally:
+                end = time.perf_counter()
+                timings[stage.name] = {"start": start - origin, "end": end - origin, "duration": end - start}
+
+        # Create futures first so stages can await each other regardless of declaration order
+        for name in self.stages:
+            futures[name] = asyncio.get_running_loop().create_future()
+        tasks = {}
+        for name, stage in self.stages.items():
+            task = asyncio.create_task(run_stage(stage))
+            task.add_done_callback(lambda t, name=name: _transfer(t, futures[name]))
+            tasks[name] = task
+
+        halted = None
+        try:
+            await asyncio.gather(*tasks.values())
+        except PipelineHalt as halt:
+            halted = halt
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            # Mark failures as retrieved: the first one is already raised by gather
+            for future in futures.values():
+                if future.done() and not future.cancelled():
+                    future.exception()
+
+        results = {
+            name: futures[name].result() for name in self.stages
+            if futures[name].done() and not futures[name].cancelled() and futures[name].exception() is None
+        }
+        trace = {
+            "total": time.perf_counter() - origin,
+            "stages": timings,
+            "critical_path": self._critical_path(timings),
+            "halted": halted.stage if halted else None,
+        }
+        return results, trace
+
+    def _critical_path(self, timings: dict) -> list:
+        """Walk back from the last stage to finish through the input that finished last"""
+        if not timings:
+            return []
+        current = max(timings, key=lambda name: timings[name]["end"])
+        path = [current]
+        while True:
+            deps = [dep for dep in self.stages[current].inputs if dep in timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda name: timings[name]["end"])
+            path.append(current)
+        return list(reversed(path))
+
+
+def _transfer(task: asyncio.Task, future: asyncio.Future):
+    """Copy a stage task's outcome into the future awaited by dependent stages"""
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
@@ -0,0 +1,304 @@
+# app/core/retrieval.py
+"""Facets and keyword ranking for knowledge-base retrieval.
+
+- Facets (pH class, texture class, salinity, deficiencies) are derived from the
+  normalized report parameters with the usual interpretation thresholds.
+- Chunks are tagged with the same vocabulary at ingestion (keyword detection,
+  `tag_<name>` metadata), so a facet becomes a Chroma `where` filter.
+- A BM25 index over the chunks ranks them by keywords; its ranking is fused
+  with the vector ranking by reciprocal rank fusion (see VectorStore.hybrid_query).
+- The retrieval query is a short text built from the facets instead of the
+  parameters JSON: identical diagnoses share one cached embedding.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# Tag -> keywords (accent-free, lowercase) marking a chunk as relevant to it
+TAG_KEYWORDS = {
+    "ph_acide": ["acide", "acides", "acidite", "chaulage", "chaux", "dolomie"],
+    "ph_alcalin": ["alcalin", "alcaline", "alcalinite", "basique", "calcaire"],
+    "texture_sableux": ["sableux", "sableuse", "sableuses", "sablonneux", "sablonneuse"],
+    "texture_limoneux": ["limoneux", "limoneuse", "limoneuses"],
+    "texture_argileux": ["argileux", "argileuse", "argileuses"],
+    "salinite": ["salin", "saline", "salins", "salinite", "salinisation", "sodique", "sodicite"],
+    "azote": ["azote", "azotee", "uree"],
+    "phosphore": ["phosphore", "phosphate", "phosphates", "phosphatee"],
+    "potassium": ["potassium", "potasse", "potassique"],
+    "matiere_organique": ["matiere organique", "compost", "fumier", "paillage"],
+}
+TAG_PATTERNS = {
+    tag: re.compile(r"\b(?:" + "|".join(keywords) + r")\b") for tag, keywords in TAG_KEYWORDS.items()
+}
+
+# Words of the retrieval query for each facet value
+FACET_TERMS = {
+    ("ph", "acide"): "sol acide, correction de l'acidité par chaulage",
+    ("ph", "legerement_acide"): "sol légèrement acide",
+    ("ph", "neutre"): "sol à pH neutre",
+    ("ph", "alcalin"): "sol alcalin ou calcaire",
+    ("texture", "sableux"): "sol sableux",
+    ("texture", "limoneux"): "sol limoneux",
+    ("texture", "argileux"): "sol argileux",
+    ("salinite", "legerement_salin"): "sol légèrement salin",
+    ("salinite", "salin"): "sol salin, gestion de la salinité",
+    ("salinite", "sodique"): "sol sodique",
+}
+NUTRIENT_NAMES = {
+    "azote": "azote", "phosphore": "phosphore", "potassium": "potassium", "matiere_organique": "matière organique",
+}
+
+STOPWORDS = frozenset(
+    "a au aux avec ce ces cette d dans de des du elle en est et il ils l la le les leur n ne on ou par pas "
+    "plus pour qu que qui s sa se ses son sont sur un une".split()
+)
+NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+# "Sable : 55% - Limon : 25% - Argile : 20%" (folded)
+FRACTION = re.compile(r"\b(sabl|limon|argil)\w*\s*[:=]?\s*(\d+(?:[.,]\d+)?)\s*%")
+
+
+def fold(text: str) -> str:
+    """Lowercase without accents ("Matière" -> "matiere")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in re.findall(r"[a-z0-9]+", fold(text)) if len(word) > 1 and word not in STOPWORDS]
+
+
+def text_tags(text: str) -> List[str]:
+    """Tags of a knowledge-base chunk (stored as `tag_<name>: True` metadata)"""
+    folded = fold(text)
+    return [tag for tag, pattern in TAG_PATTERNS.items() if pattern.search(folded)]
+
+
+def tag_filter(tags: Iterable[str]) -> Optional[dict]:
+    """Chroma `where` clause matching chunks with any of the tags"""
+    clauses = [{f"tag_{tag}": True} for tag in tags]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+# ---- Facets of a soil profile ----
+
+def _number(value) -> Optional[float]:
+    """Mean of the numbers in a value: scalar, "6,5", "12, 15" (samples), {"min", "max"}"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        value = [value[k] for k in ("min", "max") if k in value]
+    if isinstance(value, list):
+        numbers = [n for n in (_number(v) for v in value) if n is not None]
+    else:
+        numbers = [float(n.replace(",", ".")) for n in NUMBER.findall(str(value))]
+    return sum(numbers) / len(numbers) if numbers else None
+
+
+def _lookup(parameters: dict, pattern: str):
+    """(value, folded unit) of the first parameter whose folded name matches `pattern`"""
+    regex = re.compile(pattern)
+    for name, entry in parameters.items():
+        if regex.search(fold(str(name)).replace("_", " ").strip()):
+            if isinstance(entry, dict) and "valeur" in entry:
+                return entry["valeur"], fold(str(entry.get("unite") or "")).replace(" ", "").replace("μ", "u")
+            return entry, ""
+    return None, ""
+
+
+def _measure(parameters: dict, pattern: str, factors: Dict[str, float]) -> Optional[float]:
+    """Numeric value converted with the factor of its unit (None if the unit is unknown)"""
+    value, unit = _lookup(parameters, pattern)
+    number = _number(value) if value is not None else None
+    if number is None or unit not in factors:
+        return None
+    return number * factors[unit]
+
+
+def _triangle(clay: Optional[float], sand: Optional[float]) -> Optional[str]:
+    """Simplified texture triangle of the clay and sand percentages"""
+    if clay is None and sand is None:
+        return None
+    if clay is not None and clay >= 35:
+        return "argileux"
+    if sand is not None and sand >= 70:
+        return "sableux"
+    return "limoneux"
+
+
+def _texture(parameters: dict) -> Optional[str]:
+    value, _ = _lookup(parameters, r"^texture")
+    if isinstance(value, str):
+        folded = fold(value)
+        fractions = {stem: float(number.replace(",", ".")) for stem, number in FRACTION.findall(folded)}
+        if fractions:
+            return _triangle(fractions.get("argil"), fractions.get("sabl"))
+        # Class name only; compound classes are named after their last term ("argilo-sableux" is sandy)
+        positions = {texture: folded.rfind(stem) for texture, stem in
+                     (("sableux", "sabl"), ("limoneux", "limon"), ("argileux", "argil"))}
+        texture, position = max(positions.items(), key=lambda item: item[1])
+        if position >= 0:
+            return texture
+    # Granulometry, either as parameters or nested in "Texture"
+    fractions = parameters
+    if isinstance(value, dict):
+        fractions = value
+    return _triangle(_number(_lookup(fractions, r"^argile")[0]), _number(_lookup(fractions, r"^sable")[0]))
+
+
+def soil_facets(parameters: dict) -> dict:
+    """Diagnostic classes of normalized parameters, e.g.
+    {"ph": "acide", "texture": "sableux", "salinite": "salin", "carences": ["phosphore"]}.
+    Parameters that are missing or in an unknown unit are left out.
+    """
+    facets = {}
+
+    ph = _number(_lookup(parameters, r"^ph\b(?!.*kcl)")[0])
+    if ph is not None:
+        facets["ph"] = "acide" if ph < 5.5 else "legerement_acide" if ph < 6.5 else "neutre" if ph <= 7.5 else "alcalin"
+
+    texture = _texture(parameters)
+    if texture:
+        facets["texture"] = texture
+
+    # Conductivity in dS/m (= mS/cm); PSE/ESP in % of the CEC
+    ec = _measure(parameters, r"^(?:conductivite|ce$|ec$)",
+                  {"ds/m": 1, "ms/cm": 1, "us/cm": 0.001, "": 1})
+    if ec is not None and ec > 50:
+        ec /= 1000  # no unit given: a value this high is in µS/cm
+    esp = _measure(parameters, r"^(?:pse|esp)\b", {"%": 1, "": 1})
+    if esp is not None and esp >= 15:
+        facets["salinite"] = "sodique"
+    elif ec is not None and ec >= 4:
+        facets["salinite"] = "salin"
+    elif ec is not None and ec >= 2:
+        facets["salinite"] = "legerement_salin"
+
+    # Deficiency thresholds: MO < 1.5 %, N < 0.1 %, P < 10 mg/kg, K < 0.2 cmol/kg
+    organic = _measure(parameters, r"^(?:matiere organique|mo$)", {"%": 1, "": 1, "g/kg": 0.1})
+    if organic is None:
+        carbon = _measure(parameters, r"^carbone", {"%": 1, "": 1, "g/kg": 0.1})
+        organic = carbon * 1.724 if carbon is not None else None
+    nitrogen = _measure(parameters, r"^(?:azote|n$)", {"%": 1, "": 1, "g/kg": 0.1, "‰": 0.1, "mg/kg": 0.0001})
+    phosphorus = _measure(parameters, r"^(?:phosphore|p$)", {"mg/kg": 1, "ppm": 1, "": 1, "mg/100g": 10})
+    potassium = _measure(parameters, r"^(?:potassium|k$)",
+                         {"cmol/kg": 1, "cmol+/kg": 1, "cmolc/kg": 1, "meq/100g": 1, "": 1,
+                          "mg/kg": 1 / 391, "ppm": 1 / 391})
+    deficiencies = [
+        name for name, value, threshold in (
+            ("matiere_organique", organic, 1.5), ("azote", nitrogen, 0.1),
+            ("phosphore", phosphorus, 10), ("potassium", potassium, 0.2),
+        )
+        if value is not None and value < threshold
+    ]
+    if deficiencies:
+        facets["carences"] = deficiencies
+    return facets
+
+
+def facet_tags(facets: dict) -> List[str]:
+    """Chunk tags relevant to a profile: acid/alkaline pH, texture, salinity, deficient nutrients"""
+    tags = []
+    if facets.get("ph") in ("acide", "legerement_acide"):
+        tags.append("ph_acide")
+    elif facets.get("ph") == "alcalin":
+        tags.append("ph_alcalin")
+    if facets.get("texture"):
+        tags.append(f"texture_{facets['texture']}")
+    if facets.get("salinite"):
+        tags.append("salinite")
+    tags.extend(facets.get("carences", []))
+    return tags
+
+
+def facet_query(facets: dict, parameters: dict) -> str:
+    """Short retrieval query describing the profile (parameter list when no facet is known)"""
+    parts = [FACET_TERMS[(facet, facets[facet])] for facet in ("ph", "texture", "salinite") if facet in facets]
+    if facets.get("carences"):
+        parts.append("carence en " + ", ".join(NUTRIENT_NAMES[name] for name in facets["carences"]))
+    if not parts:
+        parts = [
+            f"{name} {entry.get('valeur') if isinstance(entry, dict) else entry}"
+            for name, entry in parameters.items()
+        ]
+    return "; ".join(parts) + ". Amendements, fertilisation et cultures adaptées."
+
+
+# ---- Keyword ranking ----
+
+class KeywordIndex:
+    """Okapi BM25 over the knowledge-base chunks, held in memory.
+    Updated incrementally (add/remove); not thread-safe: mutate it from one thread
+    (the event loop) or build a new index and swap it in.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = {}  # id -> (document, metadata)
+        self.terms = {}   # id -> Counter of terms
+        self.lengths = {}
+        self.document_frequency = Counter()
+        self.total_length = 0
+        self.average_length = 0.0
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict]):
+        """Index chunks, replacing those already indexed under the same IDs"""
+        self.remove(ids)
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            counts = Counter(tokenize(document or ""))
+            self.chunks[chunk_id] = (document, metadata or {})
+            self.terms[chunk_id] = counts
+            self.lengths[chunk_id] = sum(counts.values())
+            self.total_length += self.lengths[chunk_id]
+            self.document_frequency.update(counts.keys())
+        self.average_length = self.total_length / len(self.lengths) if self.lengths else 0.0
+
+    def remove(self, ids: Iterable[str]):
+        for chunk_id in ids:
+            if chunk_id not in self.chunks:
+                continue
+            del self.chunks[chunk_id]
+            self.total_length -= self.lengths.pop(chunk_id)
+            for term in self.terms.pop(chunk_id):
+                self.document_frequency[term] -= 1
+                if self.document_frequency[term] <= 0:
+                    del self.document_frequency[term]
+        self.average_length = self.total_length / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, n: int, tags: Iterable[str] = ()) -> List[str]:
+        """IDs of the `n` best chunks for the query, among chunks with any of the tags (if given)"""
+        chunks, terms, lengths = self.chunks, self.terms, self.lengths
+        keys = [f"tag_{tag}" for tag in tags]
+        total = len(chunks)
+        query_terms = set(tokenize(query))
+        scores = {}
+        for chunk_id, counts in terms.items():
+            if keys and not any(chunks[chunk_id][1].get(key) for key in keys):
+                continue
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term)
+                if not tf:
+                    continue
+                df = self.document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[chunk_id] / (self.average_length or 1))
+                score += idf * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores[chunk_id] = score
+        return sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))[:n]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge rankings by summing 1 / (k + rank): no score calibration needed between them"""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (k + rank + 1)
+    return sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))
@@ -0,0 +1,283 @@
+# app/core/rule_extractor.py
+"""Deterministic extraction of soil parameters from report text.
+
+Most lab reports are tables or "name = value unit" lines ("pH = 6.5",
+"MO 2.3%", "P: 12, 15, 18 ppm"). Those are parsed here with compiled
+patterns, so the LLM extractor is only needed for unusual layouts.
+Tables extracted by PyMuPDF come one cell per line (name, value, unit on
+consecutive lines): they are joined back into rows first, as are
+pipe-delimited rows.
+The output has the same structure as the LLM extraction:
+{"pH": {"valeur": "6.5", "unite": ""}, "phosphore": {"valeur": "12, 15", "unite": "ppm"}}
+Values outside a plausible range for their unit, or conflicting units, lower
+the confidence so the LLM takes over.
+"""
+import re
+from typing import Tuple
+
+# Parameter key -> (names matched case-insensitively, symbols matched case-sensitively).
+# Symbols (P, K, N, Ca, CE...) keep their case so ordinary words do not match.
+# Order matters: more specific names first (C/N before carbone, pH KCl before pH).
+SYNONYMS = {
+    "c_n": ([r"rapport\s+C\s*/\s*N", r"C\s*/\s*N"], []),
+    "ph_kcl": ([r"pH\s*[-_]?\s*KCl"], []),
+    "pH": ([r"pH\s*(?:[-_]?\s*(?:eau|H2O|water))?"], []),
+    "matiere_organique": ([r"mati[eè]res?\s+organiques?"], [r"M\.\s*O\.?", r"MO"]),
+    "carbone_organique": ([r"carbone(?:\s+organique)?(?:\s+total)?"], [r"C\s*org(?:anique)?", r"COT?"]),
+    "azote_total": ([r"azote(?:\s+total)?"], [r"N\s*(?:total|tot\.?)", r"N"]),
+    "phosphore": ([r"phosphore(?:\s+(?:assimilable|total|olsen|bray))?"], [r"P2O5", r"P\s*(?:ass(?:imilable)?|olsen|Olsen|Bray)", r"P"]),
+    "potassium": ([r"potassium(?:\s+[eé]changeable)?"], [r"K2O", r"K\+?"]),
+    "calcium": ([r"calcium(?:\s+[eé]changeable)?"], [r"Ca(?:2\+|\+\+)?"]),
+    "magnesium": ([r"magn[eé]sium(?:\s+[eé]changeable)?"], [r"Mg(?:2\+|\+\+)?"]),
+    "sodium": ([r"sodium(?:\s+[eé]changeable)?"], [r"Na\+?"]),
+    "cec": ([r"capacit[eé]\s+d['’]\s*[eé]change\s+cationique"], [r"C\.?E\.?C\.?"]),
+    "conductivite_electrique": ([r"conductivit[eé](?:\s+[eé]lectrique)?"], [r"C\.?E\.?", r"EC"]),
+    "argile": ([r"argiles?"], []),
+    "limon": ([r"limons?(?:\s+(?:fins?|grossiers?))?"], []),
+    "sable": ([r"sables?(?:\s+(?:fins?|grossiers?))?"], []),
+}
+
+# Core parameters used to judge whether a report was covered well enough
+CORE_PARAMETERS = ["pH", "matiere_organique", "azote_total", "phosphore", "potassium", "cec"]
+
+# Plausible values per parameter and normalized unit ("" = no unit given).
+# A match with a value outside its range is discarded and counted as an issue.
+PLAUSIBLE_RANGES = {
+    "pH": {"": (0, 14)},
+    "ph_kcl": {"": (0, 14)},
+    "c_n": {"": (0, 100)},
+    "matiere_organique": {"": (0, 1000), "%": (0, 100), "g/kg": (0, 1000)},
+    "carbone_organique": {"": (0, 600), "%": (0, 60), "g/kg": (0, 600)},
+    "azote_total": {"": (0, 5), "%": (0, 1), "g/kg": (0, 10), "ppm": (0, 10000)},
+    "phosphore": {"": (0, 2000), "ppm": (0, 2000), "mg/100g": (0, 200), "g/kg": (0, 5), "%": (0, 0.5)},
+    "potassium": {"": (0, 5000), "meq/100g": (0, 10), "ppm": (0, 5000), "mg/100g": (0, 500), "%": (0, 5)},
+    "calcium": {"": (0, 20000), "meq/100g": (0, 80), "ppm": (0, 20000), "mg/100g": (0, 2000)},
+    "magnesium": {"": (0, 5000), "meq/100g": (0, 40), "ppm": (0, 5000), "mg/100g": (0, 500)},
+    "sodium": {"": (0, 5000), "meq/100g": (0, 40), "ppm": (0, 5000), "mg/100g": (0, 500)},
+    "cec": {"": (0, 150), "meq/100g": (0, 150)},
+    "conductivite_electrique": {"": (0, 50000), "ds/m": (0, 50), "us/cm": (0, 50000)},
+    "argile": {"": (0, 1000), "%": (0, 100), "g/kg": (0, 1000)},
+    "limon": {"": (0, 1000), "%": (0, 100), "g/kg": (0, 1000)},
+    "sable": {"": (0, 1000), "%": (0, 100), "g/kg": (0, 1000)},
+}
+UNIT_CLASSES = {"mg/kg": "ppm", "mg/l": "ppm", "‰": "g/kg", "g/100g": "%", "cmol/kg": "meq/100g",
+                "cmol+/kg": "meq/100g", "cmol(+)/kg": "meq/100g", "cmolc/kg": "meq/100g", "ms/cm": "ds/m"}
+
+# Methodology lines ("NaHCO3 0,5 M pH 8,5", "méthode Olsen") describe reagents, not
+# results: nothing is read from them
+METHODOLOGY_LINE = re.compile(
+    r"m[ée]thode|extraction|extractant|r[ée]actif|tampon|dosage|selon\b|norme|\bISO\b|NF\s*X"
+    r"|NaHCO3|NH4OAc|CH3COONH4|\d\s*(?:(?-i:M)|mol\s*/\s*l)\b",
+    re.IGNORECASE
+)
+# Addresses, coordinates and prose: symbols (N, P, K...) are not trusted there,
+# only full parameter names ("Coordonnées GPS : N 14.6937 W 17.4441")
+NO_SYMBOL_LINE = re.compile(r"gps|coordonn[ée]es|latitude|longitude|adresse|t[ée]l[ée]?phone|\bt[ée]l\b|fax|\bBP\b|\brue\b", re.IGNORECASE)
+PROSE_MIN_WORDS = 8
+
+NUM = r"\d+(?:[.,]\d+)?"
+RANGE = rf"{NUM}(?:\s*(?:-|–|à)\s*{NUM})?"
+# Several samples: numbers separated by ";", ", " or spaces ("6,5" alone is a decimal)
+VALUES = rf"(?P<values>{RANGE}(?:(?:\s*;\s*|,\s+|\s+){RANGE})*)"
+UNIT = (
+    r"(?P<unit>%|‰|ppm|mg\s*/\s*kg|g\s*/\s*kg|mg\s*/\s*100\s*g|g\s*/\s*100\s*g|"
+    r"meq\s*/\s*100\s*g|cmol\s*(?:\(\s*\+\s*\)|\+|c)?\s*/\s*kg|mS\s*/\s*cm|dS\s*/\s*m|[µu]S\s*/\s*cm|mg\s*/\s*l)"
+)
+# Name, optional unit in parentheses or brackets, optional separator, values, optional unit
+LINE_TEMPLATE = (
+    r"(?<![\w/]){name}(?![\w/])\s*(?:[\(\[](?P<unit_before>[^\)\]]{{1,20}})[\)\]])?\s*"
+    r"(?:[:=]|est\s+de|est)?\s*" + VALUES + r"(?![\d.,])\s*" + UNIT + r"?"
+)
+
+PATTERNS = []  # (key, pattern, matches a symbol only)
+for _key, (_names, _symbols) in SYNONYMS.items():
+    if _names:
+        PATTERNS.append((_key, re.compile(LINE_TEMPLATE.format(name=f"(?:{'|'.join(_names)})"), re.IGNORECASE), False))
+    if _symbols:
+        PATTERNS.append((_key, re.compile(LINE_TEMPLATE.format(name=f"(?:{'|'.join(_symbols)})")), True))
+
+# Cells of a table extracted one per line: a value ("6.4", "< 0,5", "4.2 - 6.3") or a unit ("%", "-")
+VALUE_LINE = re.compile(rf"[<>≤≥~]?\s*{RANGE}")
+UNIT_LINE = re.compile(rf"{UNIT}|[-–]", re.IGNORECASE)
+
+TEXTURE_PATTERN = re.compile(
+    r"\btexture\s*(?:[:=]|est)?\s*(?P<value>[a-zA-ZÀ-ÿ][a-zA-ZÀ-ÿ\- ]{2,40}?)\s*(?:$|[,;.(])",
+    re.IGNORECASE | re.MULTILINE
+)
+UNIT_BEFORE_PATTERN = re.compile(UNIT, re.IGNORECASE)
+
+
+def _clean_number(value: str) -> str:
+    """French decimal comma -> dot; normalized range separator"""
+    value = re.sub(r"(\d),(\d)", r"\1.\2", value)
+    return re.sub(r"\s*(?:-|–|à)\s*", " - ", value)
+
+
+def _split_values(values: str) -> list:
+    """One entry per sample: single values or ranges"""
+    return [_clean_number(v) for v in re.findall(RANGE, values)]
+
+
+def _normalize_unit(unit: str) -> str:
+    unit = re.sub(r"\s+", "", unit)
+    return "µS/cm" if unit.lower() == "us/cm" else unit
+
+
+def _unit_class(unit: str) -> str:
+    unit = unit.lower().replace("µ", "u")
+    return UNIT_CLASSES.get(unit, unit)
+
+
+def _plausible(key: str, values: list, unit: str) -> bool:
+    """Every value (both ends of a range) within the range of `key` for `unit`;
+    parameters or units without a known range are accepted"""
+    bounds = PLAUSIBLE_RANGES.get(key, {}).get(_unit_class(unit))
+    if bounds is None:
+        return True
+    low, high = bounds
+    return all(low <= float(number) <= high for value in values for number in re.findall(r"\d+(?:\.\d+)?", value))
+
+
+def _is_prose(line: str) -> bool:
+    """Sentence rather than a table row: many words, few numbers"""
+    words = re.findall(r"[a-zA-ZÀ-ÿ]{2,}", line)
+    return len(words) >= PROSE_MIN_WORDS and len(re.findall(NUM, line)) < len(words) / 4
+
+
+def table_rows(lines: list) -> list:
+    """Rows of the text: pipes between cells become spaces, and a parameter name line
+    without numbers followed by value lines (one per sample) and an optional unit
+    line is joined into one "name values unit" row"""
+    lines = [re.sub(r"\s*\|\s*", " ", line).strip() for line in lines]
+    rows, i = [], 0
+    while i < len(lines):
+        line = lines[i]
+        if line and not re.search(r"\d", line) and mentions_parameter(line):
+            j = i + 1
+            while j < len(lines) and VALUE_LINE.fullmatch(lines[j]):
+                j += 1
+            if j > i + 1:
+                row = [line, *lines[i + 1:j]]
+                if j < len(lines) and UNIT_LINE.fullmatch(lines[j]):
+                    if lines[j] not in ("-", "–"):
+                        row.append(lines[j])
+                    j += 1
+                rows.append(" ".join(row))
+                i = j
+                continue
+        rows.append(line)
+        i += 1
+    return rows
+
+
+def extract_rule_based(text: str) -> Tuple[dict, float]:
+    """Extract parameters with patterns; returns (parameters, confidence in [0, 1]).
+    Values are kept in document order, one per sample (repeated values included).
+    """
+    found = {}  # key -> {"values": [...], "unit": str}
+    issues = 0  # implausible values and conflicting units
+
+    for line in table_rows(text.splitlines()):
+        if not line or not re.search(r"\d", line) or METHODOLOGY_LINE.search(line):
+            continue
+        symbols_allowed = not (NO_SYMBOL_LINE.search(line) or _is_prose(line))
+        taken = []  # character spans already attributed to a parameter on this line
+        for key, pattern, symbol in PATTERNS:
+            if symbol and not symbols_allowed:
+                continue
+            for match in pattern.finditer(line):
+                span = match.span()
+                if any(span[0] < end and start < span[1] for start, end in taken):
+                    continue
+                taken.append(span)
+                unit = match.group("unit") or ""
+                if not unit and match.group("unit_before"):
+                    inner = UNIT_BEFORE_PATTERN.search(match.group("unit_before"))
+                    unit = inner.group(0) if inner else ""
+                unit = _normalize_unit(unit) if unit else ""
+                entry = found.setdefault(key, {"values": [], "unit": ""})
+                values = _split_values(match.group("values"))
+                if not _plausible(key, values, unit or entry["unit"]):
+                    issues += 1
+                    continue
+                if unit and entry["unit"] and _unit_class(unit) != _unit_class(entry["unit"]):
+                    issues += 1
+                entry["values"].extend(values)
+                if unit and not entry["unit"]:
+                    entry["unit"] = unit
+
+    parameters = {
+        key: {"valeur": ", ".join(entry["values"]), "unite": entry["unit"]}
+        for key, entry in found.items() if entry["values"]
+    }
+
+    texture = TEXTURE_PATTERN.search(text)
+    if texture:
+        parameters["texture"] = {"valeur": texture.group("value").strip(), "unite": ""}
+
+    return parameters, rule_confidence(parameters, issues)
+
+
+def rule_confidence(parameters: dict, issues: int = 0) -> float:
+    """Share of core parameters found, with a small bonus for additional ones.
+    Halved for every implausible value or unit conflict, so that a doubtful
+    extraction goes to the LLM even when coverage is good.
+    """
+    if not parameters:
+        return 0.0
+    core = [key for key in CORE_PARAMETERS if key in parameters]
+    # Organic carbon is an acceptable substitute for organic matter
+    if "matiere_organique" not in parameters and "carbone_organique" in parameters:
+        core.append("carbone_organique")
+    coverage = len(core) / len(CORE_PARAMETERS)
+    extra = min(1.0, (len(parameters) - len(core)) / 4)
+    return round((0.8 * coverage + 0.2 * extra) * 0.5 ** issues, 3)
+
+
+# Any parameter name or symbol, used to spot the parts of a report worth sending to the LLM
+NAME_PATTERNS = [
+    re.compile(r"(?<![\w/])(?:" + "|".join(n for names, _ in SYNONYMS.values() for n in names) + r"|texture)(?![\w/])", re.IGNORECASE),
+    re.compile(r"(?<![\w/])(?:" + "|".join(s for _, symbols in SYNONYMS.values() for s in symbols) + r")(?![\w/])"),
+]
+
+
+def mentions_parameter(line: str) -> bool:
+    return any(pattern.search(line) for pattern in NAME_PATTERNS)
+
+
+def score_lines(lines: list, window: int = 1) -> list:
+    """Relevance of each line for parameter extraction:
+    2 = parameter name and number on the same line ("pH eau 5.3 6.1"),
+    1 = table split over lines: a header naming parameters without values next
+        to a row made mostly of numbers (both lines get 1),
+    0 = irrelevant (boilerplate, methodology, addresses...).
+    """
+    named = [mentions_parameter(line) for line in lines]
+    numeric = [bool(re.search(r"\d", line)) for line in lines]
+    dense = [len(re.findall(NUM, line)) >= max(1, len(line.split()) / 2) for line in lines]
+    header = [n and not d for n, d in zip(named, numeric)]
+
+    def near(i, flags):
+        return any(flags[j] for j in range(max(0, i - window), min(len(lines), i + window + 1)) if j != i)
+
+    scores = []
+    for i in range(len(lines)):
+        if named[i] and numeric[i]:
+            scores.append(2)
+        elif (dense[i] and near(i, header)) or (header[i] and near(i, dense)):
+            scores.append(1)
+        else:
+            scores.append(0)
+    return scores
+
+
+def with_context(lines: list, scores: list, window: int) -> list:
+    """Scores where value and unit lines ("6.4", "%", "cmol(+)/kg") within `window`
+    lines of a relevant line take its score, so cells of a table extracted one per
+    line keep their values and units when the text is filtered"""
+    expanded = list(scores)
+    for i, line in enumerate(lines):
+        if scores[i] or not (VALUE_LINE.fullmatch(line) or UNIT_LINE.fullmatch(line)):
+            continue
+        expanded[i] = max(scores[max(0, i - window):i + window + 1])
+    return expanded
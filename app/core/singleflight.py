@@ -0,0 +1,126 @@
+# app/core/singleflight.py
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from app.core.cache import Cache, cache
+from app.core.config import settings
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """Deduplicate concurrent computations of the same cache key.
+
+    The first caller for a key (the leader) runs `compute`, which must store its
+    result in the cache under that key. Other callers (followers) wait for it:
+    - in the same process, on the leader's future;
+    - in other Uvicorn workers, through a Redis lock (SET NX) polled with
+      asyncio.sleep until it is released, then read the result from the cache.
+    If a remote leader fails or times out, the follower computes the value itself.
+    If Redis is unreachable, the value is computed locally (in-process dedup only).
+    """
+
+    def __init__(self, cache: Cache, lock_ttl: int, wait_timeout: int):
+        self.cache = cache
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self._inflight = {}  # key -> asyncio.Future of the local leader
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.followers += 1
+            try:
+                # shield: a follower going away must not cancel the leader's work
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. its client disconnected): take over
+                return await self.do(key, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run(key, compute)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers retrieve the exception; mark it as retrieved if there are none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _run(self, key: str, compute):
+        client = self.cache.redis_client
+        if client is None:
+            self.leaders += 1
+            return await compute()
+
+        import redis  # installed whenever a Redis client exists
+
+        lock_key = f"singleflight:lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await asyncio.to_thread(client.set, lock_key, token, nx=True, px=self.lock_ttl * 1000)
+        except redis.RedisError as e:
+            logger.warning("Single-flight lock error, computing %s locally: %s", key, e)
+            self.leaders += 1
+            return await compute()
+        if not acquired:
+            # Another worker is computing this key: wait for it, then read its result
+            self.followers += 1
+            try:
+                await self._wait_remote(client, lock_key)
+            except redis.RedisError as e:
+                logger.warning("Single-flight wait error for %s: %s", key, e)
+            result = await asyncio.to_thread(self.cache.get, key)
+            if result is not None:
+                return result
+            logger.warning("Single-flight leader for %s gave no result, computing locally", key)
+
+        self.leaders += 1
+        try:
+            return await compute()
+        finally:
+            if acquired:
+                await asyncio.to_thread(self._release, client, lock_key, token)
+
+    async def _wait_remote(self, client, lock_key: str):
+        # Each check is one short EXISTS in a worker thread; the wait itself sleeps on
+        # the event loop, so followers do not hold executor threads for minutes
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        while time.monotonic() < deadline:
+            if not await asyncio.to_thread(client.exists, lock_key):
+                return
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 1.0)
+
+    def _release(self, client, lock_key: str, token: str):
+        try:
+            # Only delete our own lock (it may have expired and been taken over)
+            if client.get(lock_key) == token.encode():
+                client.delete(lock_key)
+        except Exception as e:
+            logger.warning("Single-flight release error: %s", e)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._inflight)}
+
+
+# Global single-flight instance, keyed on report cache keys
+single_flight = SingleFlight(cache, settings.SINGLEFLIGHT_LOCK_TTL, settings.SINGLEFLIGHT_WAIT_TIMEOUT)
@@ -0,0 +1,116 @@
+# app/core/startup.py
+"""Warm startup: build the per-worker resources before the first request.
+
+Without it, the first request of each worker builds the orchestrator (which
+opens Chroma), spawns the OCR processes and loads the tokenizer. The FastAPI
+lifespan calls `start_warm_up`, which builds the independent pieces
+concurrently in worker threads. `state` records how long each phase took,
+including the import of the application modules, for GET /ready and the
+soilsmart_startup_duration_seconds metric.
+"""
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import STARTUP_DURATION
+
+logger = get_logger(__name__)
+
+# "cold" -> "warming" -> "ready" | "degraded" (a component failed; it is retried lazily), or "off"
+state = {"status": "cold", "phases": {}, "components": {}}
+
+_task = None
+
+
+def record_phase(name: str, seconds: float):
+    state["phases"][name] = round(seconds, 3)
+    STARTUP_DURATION.set(seconds, phase=name)
+
+
+def _vector_store():
+    from app.core.vector_store import get_vector_store
+    vstore = get_vector_store()
+    vstore.refresh_keywords()
+    return {"chunks": len(vstore.keywords.chunks)}
+
+
+def _orchestrator():
+    from app.agents.orchestrator_agent import get_orchestrator
+    # Its recommender waits for the vector store being opened concurrently (same singleton)
+    get_orchestrator()
+
+
+def _ocr():
+    import pytesseract
+    from app.agents.ocr_agent import warm_ocr_pool
+    detail = {}
+    if settings.OCR_MODE == "process":
+        detail["workers"] = warm_ocr_pool()
+    detail["tesseract"] = str(pytesseract.get_tesseract_version())
+    return detail
+
+
+def _embedder():
+    from app.core.embeddings import get_embedder
+    embedder = get_embedder()
+    if hasattr(embedder.embedder, "load"):
+        embedder.embedder.load()  # local model
+    return {"backend": embedder.backend, "model": embedder.model}
+
+
+def _tokenizer():
+    from app.core.utils import count_tokens
+    count_tokens("")  # loads the tiktoken encoding (downloaded on first use)
+
+
+COMPONENTS = {
+    "vector_store": _vector_store,
+    "orchestrator": _orchestrator,
+    "ocr": _ocr,
+    "embedder": _embedder,
+    "tokenizer": _tokenizer,
+}
+
+
+async def warm_up():
+    """Build all components concurrently; a failure is logged, not raised"""
+    state["status"] = "warming"
+    started = time.perf_counter()
+
+    async def warm(name, build):
+        component_started = time.perf_counter()
+        try:
+            detail = await asyncio.to_thread(build)
+            entry = {"status": "ready"}
+            if detail:
+                entry["detail"] = detail
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)
+            entry = {"status": "error", "error": str(e)}
+        entry["seconds"] = round(time.perf_counter() - component_started, 3)
+        state["components"][name] = entry
+        STARTUP_DURATION.set(entry["seconds"], phase=name)
+
+    await asyncio.gather(*(warm(name, build) for name, build in COMPONENTS.items()))
+    record_phase("warm_up", time.perf_counter() - started)
+    failed = [name for name, entry in state["components"].items() if entry["status"] != "ready"]
+    state["status"] = "degraded" if failed else "ready"
+    logger.info("Warm-up %s in %.1fs", state["status"], state["phases"]["warm_up"],
+                extra={"startup": state["phases"], "failed": failed})
+
+
+async def start_warm_up(mode: str):
+    """blocking: return once warm; background: return at once; off: build lazily"""
+    global _task
+    if mode == "off":
+        state["status"] = "off"
+    elif mode == "background":
+        _task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+
+async def stop_warm_up():
+    if _task is not None and not _task.done():
+        _task.cancel()
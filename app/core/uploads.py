@@ -0,0 +1,39 @@
+# app/core/uploads.py
+"""Streamed reads of uploaded reports.
+
+- The upload is read in UPLOAD_CHUNK_SIZE chunks and hashed (content_hasher,
+  BLAKE2b) as it arrives: one pass, no second copy of the content.
+- Anything over MAX_UPLOAD_BYTES is rejected as early as possible: from the
+  declared size when the client sent one, otherwise as soon as the limit is
+  crossed while reading (UploadTooLarge, answered with 413).
+"""
+from typing import Tuple
+
+from fastapi import UploadFile
+
+from app.core.cache import content_hasher
+from app.core.config import settings
+
+
+class UploadTooLarge(ValueError):
+    """The uploaded file exceeds the size limit"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo).")
+        self.max_bytes = max_bytes
+
+
+async def read_upload(file: UploadFile, max_bytes: int = None) -> Tuple[bytes, str]:
+    """(content, content hash) of an upload, read chunk by chunk"""
+    max_bytes = settings.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    digest = content_hasher()
+    chunks, size = [], 0
+    while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
@@ -1,8 +1,55 @@
 # app/core/utils.py
 import re
+import threading
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Separator between pages in extracted report text (form feed, as pdftotext does)
+PAGE_SEPARATOR = "\f"
 
 def clean_text(text: str) -> str:
     """Nettoie un texte brut (supprime caractères inutiles)"""
     text = re.sub(r'\s+', ' ', text)
     text = text.strip()
     return text
+
+# Tokenizer used to measure prompts (loaded on first use; None = approximation)
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    # Called from worker threads (asyncio.to_thread): load once, publish the flag last
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                from app.core.config import settings
+                try:
+                    _encoding = tiktoken.encoding_for_model(settings.MODEL_NAME)
+                except KeyError:
+                    _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Not installed, or the encoding file cannot be downloaded
+                logger.warning("tiktoken unavailable, approximating token counts: %s", e)
+            _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens du texte pour le modèle configuré (≈ 4 caractères par token sans tiktoken)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Coupe le texte pour qu'il tienne dans max_tokens"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
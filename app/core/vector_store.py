@@ -1,23 +1,128 @@
-import chromadb
-from app.agents.baseAgent import get_openai_client
+import asyncio
+import threading
+import time
+from typing import List, Optional
 from app.core.config import settings
+from app.core.embeddings import CachedEmbedder, get_embedder
+from app.core.retrieval import KeywordIndex, reciprocal_rank_fusion, tag_filter
 
 class VectorStore:
     def __init__(self):
+        import chromadb  # optional (requirements/vector.txt), slow to import: loaded with the first store
         self.client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
-        self.collection = self.client.get_or_create_collection("agro_docs")
-        self.openai_client = get_openai_client()  # Reuse shared client
-
-    def add_document(self, text: str, metadata: dict):
-        emb = self.openai_client.embeddings.create(
-            model=settings.EMBEDDING_MODEL, input=text
-        ).data[0].embedding
-        self.collection.add(documents=[text], embeddings=[emb],
-                            metadatas=[metadata], ids=[metadata["id"]])
-
-    def query(self, query: str, n=3):
-        q_emb = self.openai_client.embeddings.create(
-            model=settings.EMBEDDING_MODEL, input=query
-        ).data[0].embedding
-        results = self.collection.query(query_embeddings=[q_emb], n_results=n)
+        self.embedder = get_embedder()  # Cached; OpenAI or local model (EMBEDDING_BACKEND)
+        # Ingestion: same model without the cache, Chroma already stores the chunk vectors
+        # (caching them would only fill the Redis memory quota)
+        self.ingest_embedder = CachedEmbedder(self.embedder.embedder, use_cache=False)
+        self.collection = self.client.get_or_create_collection(self.embedder.collection_name)
+        # BM25 index over the same chunks: updated on upsert/delete, and rebuilt from the
+        # collection in the background every RETRIEVAL_INDEX_TTL (other workers may ingest too)
+        self.keywords = KeywordIndex()
+        self._keywords_built = None
+        self._writes = 0  # local writes, to detect those racing with a rebuild
+        self._rebuild_lock = asyncio.Lock()
+        self._rebuild_task = None
+
+    async def add_document(self, text: str, metadata: dict):
+        emb = await self.embedder.embed_one(text)
+        # Chroma is synchronous (SQLite): keep it off the event loop
+        await asyncio.to_thread(self.collection.add, documents=[text], embeddings=[emb],
+                                metadatas=[metadata], ids=[metadata["id"]])
+
+    async def upsert_chunks(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """Embed and write chunks in batches: one embeddings call per EMBEDDING_BATCH_SIZE
+        texts, one Chroma upsert per INGEST_UPSERT_BATCH chunks (existing IDs are replaced)"""
+        batch = settings.INGEST_UPSERT_BATCH
+        for start in range(0, len(ids), batch):
+            end = start + batch
+            embeddings = await self.ingest_embedder.embed(texts[start:end])
+            await asyncio.to_thread(self.collection.upsert, ids=ids[start:end], documents=texts[start:end],
+                                    embeddings=embeddings, metadatas=metadatas[start:end])
+            self._writes += 1
+            self.keywords.add(ids[start:end], texts[start:end], metadatas[start:end])
+
+    async def source_metadata(self, source: str) -> Optional[dict]:
+        """Metadata of one chunk of an ingested source (doc_hash...), or None if it was never ingested"""
+        found = await asyncio.to_thread(self.collection.get, where={"source": source}, limit=1, include=["metadatas"])
+        metadatas = found.get("metadatas") or []
+        return metadatas[0] if metadatas else None
+
+    async def delete_source(self, source: str):
+        found = await asyncio.to_thread(self.collection.get, where={"source": source}, include=[])
+        if found["ids"]:
+            await asyncio.to_thread(self.collection.delete, ids=found["ids"])
+            self._writes += 1
+            self.keywords.remove(found["ids"])
+
+    async def query(self, query: str, n=3):
+        q_emb = await self.embedder.embed_one(query)
+        results = await asyncio.to_thread(self.collection.query, query_embeddings=[q_emb], n_results=n)
         return results["documents"], results["metadatas"]
+
+    def refresh_keywords(self):
+        """Rebuild the BM25 index from the collection, read in pages of RETRIEVAL_INDEX_PAGE
+        chunks, then swap it in (blocking)"""
+        writes = self._writes
+        index, offset = KeywordIndex(), 0
+        while True:
+            page = self.collection.get(include=["documents", "metadatas"], limit=settings.RETRIEVAL_INDEX_PAGE,
+                                       offset=offset)
+            index.add(page["ids"], page["documents"], page["metadatas"])
+            offset += len(page["ids"])
+            if len(page["ids"]) < settings.RETRIEVAL_INDEX_PAGE:
+                break
+        self.keywords = index
+        # A local write during the rebuild may be missing from the snapshot: rebuild again soon
+        self._keywords_built = time.monotonic() if writes == self._writes else None
+
+    async def _rebuild_keywords(self):
+        """One rebuild at a time; callers arriving meanwhile wait for it instead of starting their own"""
+        async with self._rebuild_lock:
+            if self._keywords_built is not None and time.monotonic() - self._keywords_built <= settings.RETRIEVAL_INDEX_TTL:
+                return
+            await asyncio.to_thread(self.refresh_keywords)
+
+    async def _ranked(self, keywords: KeywordIndex, query: str, q_emb: List[float], k: int, tags: List[str]) -> List[str]:
+        """Vector and BM25 rankings of chunks with any of the tags, fused"""
+        where = tag_filter(tags)
+        found = await asyncio.to_thread(self.collection.query, query_embeddings=[q_emb], n_results=k,
+                                        where=where, include=[])
+        return reciprocal_rank_fusion([found["ids"][0], keywords.search(query, k, tags)])
+
+    async def hybrid_query(self, query: str, n: int = 3, tags: List[str] = ()) -> List[str]:
+        """Best `n` chunks for the query: vector and keyword (BM25) rankings fused, restricted
+        to chunks tagged with any of `tags`, completed without the filter if too few match"""
+        if self._keywords_built is None and not self.keywords.chunks:
+            # No index yet (warm-up skipped): build it once, shared by concurrent requests
+            await self._rebuild_keywords()
+        elif self._keywords_built is None or time.monotonic() - self._keywords_built > settings.RETRIEVAL_INDEX_TTL:
+            # Stale: serve from the current index, refresh in the background
+            if self._rebuild_task is None or self._rebuild_task.done():
+                self._rebuild_task = asyncio.create_task(self._rebuild_keywords())
+        keywords = self.keywords
+        if not keywords.chunks:
+            return []
+        q_emb = await self.embedder.embed_one(query)
+        k = max(n, settings.RETRIEVAL_CANDIDATES)
+        ranked = await self._ranked(keywords, query, q_emb, k, list(tags)) if tags else []
+        if len(ranked) < n:
+            # Few tagged chunks (untagged documents, or no guide for this profile yet)
+            ranked += [chunk_id for chunk_id in await self._ranked(keywords, query, q_emb, k, [])
+                       if chunk_id not in ranked]
+        # Chunks written by other workers are not in the index until the next rebuild
+        return [keywords.chunks[chunk_id][0] for chunk_id in ranked if chunk_id in keywords.chunks][:n]
+
+
+# Vector store shared by the recommender, the /docs routes and ingestion
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def get_vector_store() -> VectorStore:
+    """Get or create the vector store (singleton; built at startup, see app/core/startup.py).
+    Opening Chroma is blocking: call it through asyncio.to_thread from async code until it exists.
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore()
+        return _vector_store
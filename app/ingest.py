@@ -0,0 +1,30 @@
+# app/ingest.py
+"""Bulk knowledge-base ingestion: `python -m app.ingest <file or directory>...`
+
+Loads PDF, .txt and .md agronomy guides into the vector store (same pipeline as
+POST /docs/upload). Unchanged documents are skipped, so it can be re-run after
+adding files to a library.
+"""
+import asyncio
+import sys
+import time
+from collections import Counter
+from app.core.ingestion import ingest_paths
+from app.core.log import get_logger
+from app.core.vector_store import get_vector_store
+
+logger = get_logger(__name__)
+
+async def main(paths):
+    start = time.perf_counter()
+    results = await ingest_paths(get_vector_store(), paths)
+    statuses = Counter(result["status"] for result in results)
+    chunks = sum(result["chunks"] for result in results)
+    logger.info("%d documents (%s), %d chunks in %.1fs", len(results),
+                ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())),
+                chunks, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python -m app.ingest <file or directory>...")
+    asyncio.run(main(sys.argv[1:]))
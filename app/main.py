@@ -1,66 +1,200 @@
 # app/main.py
-import hashlib
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from app.agents.orchestrator_agent import OrchestratorAgent
+import time
+_import_started = time.perf_counter()  # import of the application modules, see /ready
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, File, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app.core.batch import BatchError, expand_uploads, run_batch
 from app.core.cache import cache
+from app.core.config import settings
+from app.core.jobs import job_manager, run_report
+from app.core.llm_gateway import get_llm_gateway
+from app.core.log import get_logger, new_request_id, request_id_var
+from app.core.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, registry
+from app.core.singleflight import single_flight
+from app.core.startup import record_phase, start_warm_up, state as startup_state, stop_warm_up
+from app.core.uploads import UploadTooLarge, read_upload
+from app.routes import jobs, recommendations
+
+logger = get_logger(__name__)
+record_phase("import", time.perf_counter() - _import_started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Orchestrator, Chroma, OCR pool... are built here rather than on the first request
+    await start_warm_up(settings.WARMUP_MODE)
+    if settings.JOB_EMBEDDED_WORKERS:
+        await job_manager.start()
+    yield
+    await stop_warm_up()
+    await job_manager.stop()
+
+app = FastAPI(title="SoilSense API", lifespan=lifespan)
+app.include_router(jobs.router)
+app.include_router(recommendations.router)
+
+# Multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large(request: Request, exc: UploadTooLarge):
+    return JSONResponse({"detail": str(exc)}, status_code=413)
 
-app = FastAPI(title="SoilSense API")
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Rejects an oversized upload from its Content-Length, before the body is received
+    (bodies without Content-Length are checked while read, see read_upload)"""
+    max_bytes = settings.BATCH_MAX_BYTES if request.url.path == "/analyze/batch" else settings.MAX_UPLOAD_BYTES
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        return JSONResponse({"detail": str(UploadTooLarge(max_bytes))}, status_code=413)
+    return await call_next(request)
 
-# Reuse orchestrator instance to avoid recreating agents on every request
-_orchestrator = None
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """In-flight gauge and latency histogram per route (streaming responses: until the headers are sent)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        with HTTP_IN_FLIGHT.track_inprogress():
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, to keep label cardinality bounded (/jobs/{job_id})
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start, method=request.method,
+            route=route.path if route else "unmatched", status=status
+        )
 
-def get_orchestrator():
-    """Get or create orchestrator instance (singleton pattern)"""
-    global _orchestrator
-    if _orchestrator is None:
-        _orchestrator = OrchestratorAgent()
-    return _orchestrator
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Correlation ID for every log line of the request: client's X-Request-ID or a new one"""
+    request_id = request.headers.get("x-request-id", "")
+    if not (0 < len(request_id) <= 64 and request_id.replace("-", "").replace("_", "").isalnum()):
+        request_id = new_request_id()
+    request_id_var.set(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
 @app.post("/analyze")
 async def analyze(file: UploadFile = File(...)):
     """Analyzes the soil report PDF and returns a full report in French plus summaries."""
+    # Read in chunks (413 above MAX_UPLOAD_BYTES), hashed for the cache key while read
+    file_content, file_hash = await read_upload(file)
     try:
-        # Read file content for cache key generation
-        file_content = await file.read()
-        
         # Generate cache key from file hash
-        file_hash = hashlib.md5(file_content).hexdigest()
         cache_key = cache._generate_key("report", file_hash)
         
         # Try to get from cache first
-        cached_result = cache.get(cache_key)
+        # Redis I/O is blocking: run it in a worker thread
+        cached_result = await asyncio.to_thread(cache.get, cache_key)
         if cached_result:
             return JSONResponse(cached_result)
         
-        # Create a wrapper object that mimics UploadFile interface
-        # The orchestrator expects an object with .file.read() method
-        from io import BytesIO
-        
-        class FileWrapper:
-            def __init__(self, content, filename):
-                self.content = content
-                self.filename = filename
-                self.file = BytesIO(content)
-            
-            def read(self):
-                return self.content
-        
-        file_wrapper = FileWrapper(file_content, file.filename)
-        
-        # If not in cache, process the file
-        orchestrator = get_orchestrator()
-        # The orchestrator now handles all languages internally
-        report_data = orchestrator.run(file_wrapper, language="fr")
-        
-        # Cache the result (TTL from settings, default 1 hour)
-        cache.set(cache_key, report_data)
+        # If not in cache, process the file (and cache it, TTL from settings)
+        # Identical concurrent uploads wait for the same run instead of starting their own
+        report_data = await run_report(file_content, cache_key)
         
         return JSONResponse(report_data)
     except Exception as e:
+        logger.exception("Analysis failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/analyze/stream")
+async def analyze_stream(file: UploadFile = File(...)):
+    """Streams the report as Server-Sent Events: one event per section as soon as it is ready
+    (parameters, analysis, recommendations, summary), "token" events while LLM sections are
+    generated, then "done" with the full payload (or "error").
+    """
+    file_content, file_hash = await read_upload(file)
+    cache_key = cache._generate_key("report", file_hash)
+
+    async def events():
+        cached_result = await asyncio.to_thread(cache.get, cache_key)
+        if cached_result:
+            yield _sse("done", cached_result)
+            return
+
+        # A request joining an identical in-flight upload only receives "done"
+        queue = asyncio.Queue()
+        task = asyncio.create_task(run_report(
+            file_content, cache_key, on_event=lambda event, data: queue.put_nowait((event, data))
+        ))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Nothing to send yet (long OCR, or waiting on an identical in-flight upload):
+                    # a comment line keeps proxies and client read timeouts from closing the stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield _sse(*item)
+            report_data = task.result()
+            yield _sse("done", report_data)
+        except Exception as e:
+            logger.exception("Streamed analysis failed: %s", e)
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            # Client went away: stop spending tokens on this report
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """Analyzes several reports (PDFs and/or zip archives of PDFs) in one request.
+    Streams NDJSON: one "result" line per document as soon as it is ready (cached
+    reports first, identical documents analyzed once), then a "summary" line.
+    """
+    uploads, total = [], 0
+    for file in files:
+        try:
+            content, file_hash = await read_upload(file, settings.BATCH_MAX_BYTES - total)
+        except UploadTooLarge:
+            raise UploadTooLarge(settings.BATCH_MAX_BYTES)
+        total += len(content)
+        uploads.append((file.filename, content, file_hash))
+    try:
+        items = await asyncio.to_thread(expand_uploads, uploads)
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        async for entry in run_batch(items):
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "ok", "cache": "redis" if cache.redis_client else "memory"}
\ No newline at end of file
+    return {"status": "ok", "cache": "redis" if cache.redis_client else "memory", "cache_stats": cache.stats(),
+            "single_flight": single_flight.stats(), "llm": get_llm_gateway().stats()}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until the startup warm-up is done, then the duration of each startup phase"""
+    status_code = 503 if startup_state["status"] in ("cold", "warming") else 200
+    return JSONResponse(startup_state, status_code=status_code)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (text exposition format)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
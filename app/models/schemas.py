@@ -1,5 +1,6 @@
 # app/models/schemas.py
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, ConfigDict
 
 class AnalyzeRequest(BaseModel):
     file_path: str  # Optionnel si on envoie un chemin
@@ -7,3 +8,33 @@ class AnalyzeRequest(BaseModel):
 class DocumentUpload(BaseModel):
     file_path: str
     metadata: dict = {}
+
+class ExtractedParameter(BaseModel):
+    """One soil parameter as read in the report ("4.2, 5.1" for several samples, "4.2 - 6.3" for a range)"""
+    model_config = ConfigDict(extra="forbid")
+
+    nom: str
+    valeur: str
+    unite: str
+
+class ExtractionResult(BaseModel):
+    """Structured output of the extractor LLM (JSON schema sent as response_format)"""
+    model_config = ConfigDict(extra="forbid")
+
+    parametres: List[ExtractedParameter]
+
+    def to_parameters(self) -> dict:
+        """{"pH": {"valeur": "6.5", "unite": ""}, ...}: the structure the orchestrator normalizes"""
+        parameters = {}
+        for parameter in self.parametres:
+            nom, valeur = parameter.nom.strip(), parameter.valeur.strip()
+            if not nom or not valeur:
+                continue
+            if nom in parameters:
+                entry = parameters[nom]
+                # One value per sample, repeats included ("6.0, 6.0, 5.8")
+                entry["valeur"] += ", " + valeur
+                entry["unite"] = entry["unite"] or parameter.unite
+            else:
+                parameters[nom] = {"valeur": valeur, "unite": parameter.unite}
+        return parameters
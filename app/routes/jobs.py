@@ -0,0 +1,35 @@
+# app/routes/jobs.py
+import asyncio
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from app.core.cache import cache
+from app.core.jobs import job_manager, QueueFullError
+from app.core.uploads import read_upload
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@router.post("")
+async def create_job(file: UploadFile = File(...)):
+    """Queues a soil report analysis and returns its job ID immediately."""
+    file_content, file_hash = await read_upload(file)
+    cache_key = cache._generate_key("report", file_hash)
+    try:
+        job = await job_manager.submit(file.filename, file_content, cache_key)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="File d'attente pleine, réessayez plus tard.")
+    return JSONResponse({"job_id": job["id"], "status": job["status"]}, status_code=202)
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Returns the job status, per-stage progress and, once done, the report."""
+    job = await asyncio.to_thread(job_manager.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable ou expiré.")
+    result = None
+    if job["status"] == "done":
+        result = await asyncio.to_thread(cache.get, job["cache_key"])
+        if result is None:
+            job["status"] = "expired"
+    job.pop("cache_key", None)
+    job["result"] = result
+    return job
@@ -1,20 +1,28 @@
 # app/routes/recommendations.py
-from fastapi import APIRouter, UploadFile
-from app.core.vector_store import VectorStore
-import tempfile
+import asyncio
+from fastapi import APIRouter, HTTPException, UploadFile
+from app.core.ingestion import ingest_document
+from app.core.uploads import read_upload
+from app.core.vector_store import get_vector_store
 
 router = APIRouter(prefix="/docs", tags=["Documents"])
-vstore = VectorStore()
+
+async def _vector_store():
+    try:
+        return await asyncio.to_thread(get_vector_store)
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Base de connaissances indisponible (chromadb non installé).")
 
 @router.post("/upload")
 async def upload_document(file: UploadFile):
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(file.file.read())
-        tmp_path = tmp.name
-    vstore.add_document(tmp_path, {"filename": file.filename})
-    return {"status": "success", "file": file.filename}
+    """Adds a PDF or text document to the knowledge base (skipped if its content is unchanged)."""
+    content, _ = await read_upload(file)
+    vstore = await _vector_store()
+    result = await ingest_document(vstore, file.filename, content, {"filename": file.filename})
+    return {"status": "success", "file": file.filename, "ingestion": result["status"], "chunks": result["chunks"]}
 
 @router.get("/query")
 async def query_docs(query: str, n: int = 3):
-    results = vstore.query(query, n)
+    vstore = await _vector_store()
+    results = await vstore.query(query, n)
     return {"results": results}
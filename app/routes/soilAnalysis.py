@@ -7,5 +7,5 @@ router = APIRouter(prefix="/analyze", tags=["Analyse"])
 @router.post("/")
 async def analyze_pdf(file: UploadFile):
     orchestrator = OrchestratorAgent()
-    report = orchestrator.run(file)
+    report = await orchestrator.run(file)
     return {"report": report}
@@ -0,0 +1,21 @@
+# app/worker.py
+"""Standalone job worker: `python -m app.worker`
+
+Consumes the Redis job queue filled by POST /jobs, so report generation can be
+scaled separately from the web processes (set JOB_EMBEDDED_WORKERS=false on the API).
+"""
+import asyncio
+from app.core.config import settings
+from app.core.jobs import job_manager, RedisJobBackend
+from app.core.startup import start_warm_up
+
+async def main():
+    if not isinstance(job_manager.backend, RedisJobBackend):
+        raise SystemExit("❌ Standalone workers require the Redis job backend (JOB_BACKEND=redis)")
+    # Take jobs only once the orchestrator, Chroma and the OCR pool are ready
+    await start_warm_up("blocking" if settings.WARMUP_MODE == "background" else settings.WARMUP_MODE)
+    await job_manager.start()
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,14 +4,27 @@ import os
 
 load_dotenv()
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+API_MODE = os.getenv("API_MODE", "stream")  # "stream" (SSE, progressive display) or "jobs" (polling)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # seconds between status checks
+JOB_MAX_WAIT = int(os.getenv("JOB_MAX_WAIT", "900"))  # give up after 15 minutes
 
 import streamlit as st
 import requests
+import time
+import json
 from datetime import datetime
 from io import BytesIO
 import markdown
 import re
 
+JOB_STAGE_LABELS = {
+    "ocr": "Lecture du document (OCR)...",
+    "extraction": "Extraction des paramètres...",
+    "analysis": "Interprétation agronomique...",
+    "recommendations": "Recommandations et cultures...",
+    "summaries": "Résumés en Wolof et Bambara...",
+}
+
 TOPOGRAPHY_GUIDE = {
     "Plateau ferrugineux": {
         "description": "Plateau légèrement ondulé sur cuirasse latéritique avec faible profondeur utile et ruissellement rapide.",
@@ -294,6 +307,98 @@ if 'show_summaries' not in st.session_state:
 if 'current_file_id' not in st.session_state:
     st.session_state.current_file_id = None
 
+def analyze_with_job(files):
+    """Submit a background job, then poll its status: no long-held HTTP connection"""
+    response = requests.post(f"{API_URL}/jobs", files=files, timeout=60)
+    response.raise_for_status()  # Raise exception for HTTP errors
+    job_id = response.json()["job_id"]
+
+    progress_bar = st.progress(0, text="Analyse en file d'attente...")
+    deadline = time.time() + JOB_MAX_WAIT
+    try:
+        while True:
+            job = requests.get(f"{API_URL}/jobs/{job_id}", timeout=30).json()
+            done_stages = [s for s, status in job["stages"].items() if status == "done"]
+            running = [s for s, status in job["stages"].items() if status == "running"]
+            label = JOB_STAGE_LABELS.get(running[0], "Analyse en cours...") if running else "Analyse en cours..."
+            progress_bar.progress(len(done_stages) / len(job["stages"]), text=label)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] in ("error", "expired"):
+                st.error(f"Erreur de l'API: {job.get('error') or 'résultat expiré'}")
+                return {"error": True}
+            if time.time() > deadline:
+                st.error("⏱️ L'analyse a pris trop de temps. Veuillez réessayer plus tard.")
+                return {"error": True}
+            time.sleep(JOB_POLL_INTERVAL)
+    finally:
+        progress_bar.empty()
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def analyze_with_stream(files):
+    """Stream the report from /analyze/stream and render each section as soon as it arrives"""
+    # Read timeout applies between two events, not to the whole analysis
+    response = requests.post(f"{API_URL}/analyze/stream", files=files, stream=True, timeout=(30, 180))
+    response.raise_for_status()
+    response.encoding = "utf-8"
+
+    live = st.container()
+    with live:
+        params_slot = st.empty()
+        slots = {
+            "analysis": st.empty(),
+            "recommendations": st.empty(),
+            "summary_wo": st.empty(),
+            "summary_bm": st.empty(),
+        }
+    titles = {
+        "analysis": "## 🌿 Interprétation agronomique",
+        "recommendations": "## 🌾 Recommandations et cultures adaptées",
+        "summary_wo": "### 🇸🇳 Résumé en Wolof",
+        "summary_bm": "### 🇲🇱 Résumé en Bambara",
+    }
+    drafts = {section: "" for section in slots}
+
+    try:
+        for event, data in iter_sse(response):
+            if event == "parameters":
+                params_slot.markdown("## 🔍 Paramètres extraits\n" + data["table"])
+            elif event == "token" and data["section"] in slots:
+                drafts[data["section"]] += data["delta"]
+                slots[data["section"]].markdown(f"{titles[data['section']]}\n{drafts[data['section']]}▌")
+            elif event in ("analysis", "recommendations"):
+                slots[event].markdown(f"{titles[event]}\n{data['content']}")
+            elif event == "summary":
+                section = f"summary_{data['language']}"
+                if section in slots:
+                    slots[section].markdown(f"{titles[section]}\n{data['content']}")
+            elif event == "done":
+                return data
+            elif event == "error":
+                st.error(f"Erreur de l'API: {data.get('detail')}")
+                return {"error": True}
+    finally:
+        response.close()
+        # The complete report is rendered below once available
+        params_slot.empty()
+        for slot in slots.values():
+            slot.empty()
+
+    st.error("La connexion à l'API a été interrompue avant la fin de l'analyse.")
+    return {"error": True}
+
 def reset_report_state():
     st.session_state.report_data = None
     st.session_state.show_summaries = {'wo': False, 'bm': False}
@@ -318,19 +423,10 @@ if uploaded_file:
         with st.spinner("Analyse complète en cours (FR, WO, BM)..."):
             files = {"file": (uploaded_file.name, file_bytes, "application/pdf")}
             try:
-                # Use stream=True for large files to improve memory efficiency
-                response = requests.post(
-                    f"{API_URL}/analyze", 
-                    files=files, 
-                    timeout=240,
-                    stream=False  # Keep False for small PDFs, set True if files are large
-                )
-                response.raise_for_status()  # Raise exception for HTTP errors
-                if response.status_code == 200:
-                    st.session_state.report_data = response.json()
+                if API_MODE == "stream":
+                    st.session_state.report_data = analyze_with_stream(files)
                 else:
-                    st.error(f"Erreur de l'API: {response.text}")
-                    st.session_state.report_data = {"error": True}
+                    st.session_state.report_data = analyze_with_job(files)
             except requests.exceptions.Timeout:
                 st.error("⏱️ La requête a pris trop de temps. Veuillez réessayer avec un fichier plus petit.")
                 st.session_state.report_data = {"error": True}
@@ -0,0 +1,21 @@
+# tests/test_extractor_agent.py
+from app.agents.extractorAgent import ExtractorAgent
+
+
+def test_merge_keeps_one_value_per_sample():
+    merged = ExtractorAgent._merge_parameters([
+        {"pH": {"valeur": "6.0, 6.2", "unite": ""}},
+        {"pH": {"valeur": "6.0, 5.8", "unite": ""}},
+    ])
+
+    assert merged["pH"]["valeur"] == "6.0, 6.2, 6.0, 5.8"
+
+
+def test_merge_skips_values_repeated_by_a_page_header():
+    merged = ExtractorAgent._merge_parameters([
+        {"Parcelle": {"valeur": "P12", "unite": ""}, "Phosphore": {"valeur": "18", "unite": "mg/kg"}},
+        {"Parcelle": {"valeur": "P12", "unite": ""}, "Phosphore": {"valeur": "9", "unite": ""}},
+    ])
+
+    assert merged["Parcelle"]["valeur"] == "P12"
+    assert merged["Phosphore"] == {"valeur": "18, 9", "unite": "mg/kg"}
@@ -0,0 +1,14 @@
+# tests/test_retrieval.py
+from app.core.retrieval import soil_facets
+
+
+def test_texture_string_with_percentages_uses_the_triangle():
+    """A loam listing its fractions is not clay because "Argile" is the last word"""
+    facets = soil_facets({"Texture": {"valeur": "Sable : 55% - Limon : 25% - Argile : 20%", "unite": "-"}})
+
+    assert facets["texture"] == "limoneux"
+
+
+def test_texture_class_name_and_fractions():
+    assert soil_facets({"Texture": "argilo-sableux"})["texture"] == "sableux"
+    assert soil_facets({"Argile": {"valeur": "40", "unite": "%"}})["texture"] == "argileux"
@@ -0,0 +1,56 @@
+# tests/test_rule_extractor.py
+from pathlib import Path
+
+from app.core.rule_extractor import extract_rule_based, score_lines, with_context
+
+SAMPLE = Path(__file__).resolve().parents[1] / "app" / "data" / "debug" / "extracted_text.txt"
+
+
+def test_sample_report_one_cell_per_line():
+    """The repo's PyMuPDF output (name, value and unit on consecutive lines) skips the LLM"""
+    parameters, confidence = extract_rule_based(SAMPLE.read_text(encoding="utf-8"))
+
+    assert confidence >= 0.6
+    assert parameters["pH"] == {"valeur": "6.4", "unite": ""}
+    assert parameters["matiere_organique"] == {"valeur": "1.8", "unite": "%"}
+    assert parameters["azote_total"] == {"valeur": "0.12", "unite": "%"}
+    assert parameters["phosphore"] == {"valeur": "18", "unite": "mg/kg"}
+    assert parameters["potassium"] == {"valeur": "95", "unite": "mg/kg"}
+    assert parameters["cec"] == {"valeur": "12.5", "unite": "cmol(+)/kg"}
+    assert parameters["calcium"] == {"valeur": "3.6", "unite": "cmol(+)/kg"}
+    assert parameters["conductivite_electrique"] == {"valeur": "0.15", "unite": "dS/m"}
+    assert parameters["sable"] == {"valeur": "55", "unite": "%"}
+
+
+def test_pipe_delimited_table():
+    text = "\n".join([
+        "| Paramètre | Valeur | Unité |",
+        "| pH eau | 6.4 | - |",
+        "| Matière organique | 1.8 | % |",
+        "| Azote total | 0.12 | % |",
+        "| Phosphore | 18 | mg/kg |",
+        "| CEC | 12.5 | cmol/kg |",
+    ])
+    parameters, _ = extract_rule_based(text)
+
+    assert parameters["pH"]["valeur"] == "6.4"
+    assert parameters["cec"] == {"valeur": "12.5", "unite": "cmol/kg"}
+
+
+def test_repeated_sample_values_are_kept():
+    parameters, _ = extract_rule_based("pH eau 6.0 6.0 5.8")
+
+    assert parameters["pH"]["valeur"] == "6.0, 6.0, 5.8"
+
+
+def test_coordinates_and_methodology_are_ignored():
+    parameters, _ = extract_rule_based("Coordonnées GPS : N 14.6937 W 17.4441\nExtraction NaHCO3 0,5 M pH 8,5")
+
+    assert parameters == {}
+
+
+def test_context_keeps_value_and_unit_lines():
+    lines = ["Rapport d'analyse", "Phosphore assimilable", "18", "mg/kg", "Observations générales"]
+    scores = with_context(lines, score_lines(lines), 2)
+
+    assert [line for line, score in zip(lines, scores) if score] == ["Phosphore assimilable", "18", "mg/kg"]
@@ -0,0 +1,16 @@
+# tests/test_schemas.py
+from app.models.schemas import ExtractedParameter, ExtractionResult
+
+
+def test_to_parameters_keeps_repeated_sample_values():
+    result = ExtractionResult(parametres=[
+        ExtractedParameter(nom="pH", valeur="6.0", unite=""),
+        ExtractedParameter(nom="pH", valeur="6.0", unite=""),
+        ExtractedParameter(nom="pH", valeur="5.8", unite=""),
+        ExtractedParameter(nom="Phosphore", valeur="18", unite="mg/kg"),
+    ])
+
+    assert result.to_parameters() == {
+        "pH": {"valeur": "6.0, 6.0, 5.8", "unite": ""},
+        "Phosphore": {"valeur": "18", "unite": "mg/kg"},
+    }